@@ -8,7 +8,12 @@ from dotenv import load_dotenv
 
 # Initialize
 load_dotenv()
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+@st.cache_resource
+def get_client():
+    """One client (and connection pool) per process, not per rerun"""
+    return OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+client = get_client()
 
 # Emotion configuration
 EMOTIONS = [
@@ -1,13 +1,12 @@
 import streamlit as st
-from openai import OpenAI
+from llm_client import get_client
 import json
 from datetime import datetime
-import os
 from dotenv import load_dotenv
 
 # Initialize
 load_dotenv()
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+client = get_client()
 
 # Emotion list (13 emotions as requested)
 EMOTIONS = [
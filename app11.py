@@ -1,14 +1,13 @@
 import streamlit as st
-from openai import OpenAI
+from llm_client import get_client
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
-import os
 from dotenv import load_dotenv
 
 # Initialize
 load_dotenv()
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+client = get_client()
 
 # Emotion configuration
 EMOTIONS = [
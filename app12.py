@@ -1,5 +1,4 @@
 import streamlit as st
-from openai import OpenAI
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
@@ -9,7 +8,38 @@ import boto3
 import json
 from botocore.exceptions import ClientError
 import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from secret_key import AwsSecretManager
+from functools import partial
+from llm_client import get_completions, get_hedger
+from config import (EMOTIONS, TURN_MODES, TURN_MODE, CLASSIFIER_MODEL, SINGLE_CALL_MODEL, RECONCILE_POLICY,
+                    TURN_WORKERS, STREAM_RESPONSES, EMOTION_CACHE_PATH, EMOTION_CACHE_TTL,
+                    EMOTION_CACHE_MEMORY_ENTRIES, EMOTION_CACHE_DISK_ENTRIES, EMOTION_CACHE_EVICTION,
+                    LOCAL_MODEL_PATH, LOCAL_CONFIDENCE, HISTORY_TOKEN_BUDGET, MEMORY_TOKEN_BUDGET, MEMORY_TOP_K,
+                    SUMMARY_KEEP_RECENT, SUMMARY_BLOCK, SUMMARY_WORKERS, TURN_LATENCY_BUDGET,
+                    CLASSIFY_TIMEOUT, RESPONSE_TIMEOUT, HEDGE_ENABLED, MODEL_PRICES, METRICS_PORT, METRICS_HOST,
+                    CLASSIFY_METHOD, EQ_START, ACKNOWLEDGEMENTS, TRIVIAL_REPLIES, EXPORT_DIR,
+                    EXPORT_S3_BUCKET, EXPORT_S3_PREFIX, EXPORT_WORKERS, EXPORT_RETRIES, EXPORT_POLL_SECONDS,
+                    TRANSCRIPT_DIR, TRANSCRIPT_SEGMENT_BYTES, TRANSCRIPT_FSYNC_SECONDS, SESSION_DB_PATH,
+                    SESSION_COMMIT_SECONDS, SESSION_PAGE)
+from turn_pipeline import ConcurrentTurnPipeline
+from emotion_cache import EmotionCache, normalize
+from local_classifier import LocalEmotionClassifier
+from context_builder import TokenCounter, ContextBuilder
+from summarizer import RollingSummary
+from memory_index import MemoryIndex
+from rate_limiter import current_session
+from single_flight import SingleFlight
+from tracing import get_tracer, current_span, set_current_span
+from usage_ledger import UsageLedger, serve_metrics, usage_of
+from logprob_classifier import LogprobClassifier, RecentDistributions
+from eq_engine import EQEngine, EmotionTrack
+from command_router import CommandRouter
+from export_worker import ExportQueue, s3_uploader
+from transcript_log import TranscriptLog
+from session_store import SessionStore
 
 load_dotenv()
 
@@ -20,22 +50,21 @@ load_dotenv()
 # Logging config
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Initialize OpenAI API Key
-openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 secret_key_obj = AwsSecretManager()
 is_secret = secret_key_obj.get_secrets()
 
+# Process-wide OpenAI client (built once the secrets are in the environment)
+# behind retries and a circuit breaker; every call goes through it
+chat = get_completions()
+hedger = get_hedger() if HEDGE_ENABLED else None
+# Per-turn spans, exported as configured by TRACE_EXPORTER
+tracer = get_tracer()
+
 logging.info("Validate is_secret - {is_secret}")
 
 
 
 # Emotion configuration
-EMOTIONS = [
-    "happiness", "sadness", "fear", "anger", "disgust",
-    "surprise", "love", "joy", "guilt", "shame",
-    "anxiety", "envy", "frustration", "neutral"
-]
 EMOTION_COLORS = {
     "happiness": "#FFD700", "sadness": "#1E90FF", "fear": "#9370DB",
     "anger": "#FF4500", "disgust": "#32CD32", "surprise": "#FFA500",
@@ -51,30 +80,239 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def session_store():
+    """Process-wide SQLite store sessions are saved to and resumed from, None when switched off"""
+    if not SESSION_DB_PATH:
+        return None
+    return SessionStore(SESSION_DB_PATH, SESSION_COMMIT_SECONDS)
+
+def save_summary(session_id, summary, upto):
+    """Persist a fold of the rolling summary (runs on a worker), so a resume picks it up"""
+    if session_store():
+        session_store().save(session_id, summary=summary, summary_upto=upto)
+
+def resume_session(session_id):
+    """Load a stored session into this browser session: its newest
+    SESSION_PAGE messages (more if its summary doesn't reach them), its
+    summary, and every user message for the memory index and the charts.
+    False when there is no such session"""
+    saved = session_store().load(session_id, SESSION_PAGE) if session_store() else None
+    if saved is None:
+        return False
+    messages, offset, start = saved["messages"], saved["offset"], saved["start"]
+    if offset - start > saved["summary_upto"]:
+        # Load what the summary doesn't cover yet, so it can still be folded in
+        older, offset = session_store().older(session_id, offset, offset - start - saved["summary_upto"], start)
+        messages = older + messages
+    st.session_state.session_id = session_id
+    st.session_state.messages = messages
+    st.session_state.chat_start = start
+    st.session_state.message_offset = offset
+    st.session_state.emotion_history = [emotion for emotion, probs in saved["emotions"]]
+    st.session_state.conversation_context = [content for seq, content in saved["user_messages"]]
+    index = MemoryIndex()
+    for seq, content in saved["user_messages"]:
+        index.add(seq - start, content)
+    st.session_state.memory_index = index
+    st.session_state.rolling_summary = RollingSummary(
+        SUMMARY_KEEP_RECENT, SUMMARY_BLOCK, saved["summary"] or "", saved["summary_upto"],
+        on_fold=partial(save_summary, session_id)
+    )
+    track = EmotionTrack()
+    for emotion, probs in saved["emotions"]:
+        track.append(emotion, probs)
+    st.session_state.emotion_track = track
+    st.session_state.pop("eq_trajectory", None)
+    st.session_state.eq_score = EQ_START if saved["eq_score"] is None else saved["eq_score"]
+    if saved["turn_mode"] in TURN_MODES:
+        st.session_state.turn_mode = saved["turn_mode"]
+    st.session_state.pop("history_builder", None)
+    st.query_params["session"] = session_id
+    return True
+
+def load_older_messages():
+    """Prepend the previous page of this session's messages"""
+    older, offset = session_store().older(st.session_state.session_id, st.session_state.message_offset,
+                                          SESSION_PAGE, st.session_state.chat_start)
+    st.session_state.messages = older + st.session_state.messages
+    st.session_state.message_offset = offset
+    # The memory index and the summary count from the start of the chat, only
+    # the history builder is keyed by position in the loaded messages
+    st.session_state.pop("history_builder", None)
+
+def loaded_from():
+    """Position in the chat (since its last reset) of the first loaded message"""
+    return st.session_state.message_offset - st.session_state.chat_start
+
+def resume_requested():
+    requested = st.session_state.resume_id.strip()
+    if requested and not resume_session(requested):
+        st.toast(f"No stored session {requested}", icon="⚠️")
+
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
     st.session_state.emotion_history = []
     st.session_state.conversation_context = []
-    st.session_state.eq_score = 50  # Emotional Quotient (50 = neutral)
-
-# Emotional Quotient weights
-EQ_WEIGHTS = {
-    "happiness": 2, "joy": 2, "love": 3, "surprise": 1,
-    "sadness": -1, "fear": -2, "anger": -3, "disgust": -2,
-    "guilt": -1, "shame": -2, "anxiety": -2, "envy": -1,
-    "frustration": -2, "neutral": 0
-}
+    st.session_state.eq_score = EQ_START  # Emotional Quotient (50 = neutral)
+    # Position of the chat's first message, and of the first one loaded, in the stored session
+    st.session_state.chat_start = 0
+    st.session_state.message_offset = 0
+if "turn_mode" not in st.session_state:
+    st.session_state.turn_mode = TURN_MODE
+if "session_id" not in st.session_state:
+    # ?session=<id> resumes a stored session, e.g. after the tab was closed
+    requested = st.query_params.get("session")
+    if not (requested and resume_session(requested)):
+        st.session_state.session_id = uuid.uuid4().hex
+        st.query_params["session"] = st.session_state.session_id
+# LLM calls made during this run are charged to this session
+current_session.set(st.session_state.session_id)
+# A turn ends with st.rerun(); the run that renders its result is traced as
+# part of that turn, and every other run starts without a current span
+pending_turn = st.session_state.pop("pending_turn", None)
+render_span = tracer.start_span("render", parent=pending_turn) if pending_turn else None
+set_current_span(render_span)
+
+@st.cache_resource
+def eq_engine():
+    """EQ scoring with the weights, bounds and decay from config"""
+    return EQEngine()
+
+def emotion_track():
+    """This session's emotions as a compact EmotionTrack, rebuilt from the
+    stored messages when the session predates it"""
+    if "emotion_track" not in st.session_state:
+        track = EmotionTrack()
+        for m in st.session_state.messages:
+            if m["role"] == "user" and m.get("emotion"):
+                track.append(m["emotion"], m.get("emotion_probs"))
+        st.session_state.emotion_track = track
+    return st.session_state.emotion_track
+
+def eq_trajectory():
+    """Score after every turn of this session, for the chart; replayed from
+    the track once, then extended turn by turn"""
+    if "eq_trajectory" not in st.session_state:
+        st.session_state.eq_trajectory = eq_engine().trajectory(emotion_track()).tolist()
+    return st.session_state.eq_trajectory
+
+def update_eq_score(emotion, probs=None):
+    """Update Emotional Quotient score, by the expected weight when the
+    classifier returned a distribution"""
+    trajectory = eq_trajectory()
+    track = emotion_track()
+    track.append(emotion, probs)
+    trajectory.append(eq_engine().step(trajectory[-1] if trajectory else eq_engine().start, track))
+    st.session_state.eq_score = round(trajectory[-1])
+    if session_store():
+        session_store().save(st.session_state.session_id, eq_score=st.session_state.eq_score,
+                             turn_mode=st.session_state.turn_mode)
+
+@st.cache_resource
+def emotion_cache():
+    """Process-wide emotion cache, its disk tier is shared across processes"""
+    return EmotionCache(
+        EMOTION_CACHE_PATH, CLASSIFIER_MODEL, EMOTIONS,
+        ttl=EMOTION_CACHE_TTL,
+        memory_entries=EMOTION_CACHE_MEMORY_ENTRIES,
+        disk_entries=EMOTION_CACHE_DISK_ENTRIES,
+        eviction=EMOTION_CACHE_EVICTION
+    )
 
-def update_eq_score(emotion):
-    """Update Emotional Quotient score"""
-    st.session_state.eq_score += EQ_WEIGHTS.get(emotion, 0)
-    st.session_state.eq_score = max(0, min(100, st.session_state.eq_score))
+@st.cache_resource
+def local_classifier():
+    """Local first-tier classifier, None until a model has been trained"""
+    if not os.path.exists(LOCAL_MODEL_PATH):
+        return None
+    return LocalEmotionClassifier.load(LOCAL_MODEL_PATH, threshold=LOCAL_CONFIDENCE)
 
-def detect_emotion(text):
+def call_deadline(turn_deadline, cap):
+    """Absolute deadline for one call: its own cap, within the turn's budget"""
+    deadline = time.monotonic() + cap
+    return deadline if turn_deadline is None else min(deadline, turn_deadline)
+
+@st.cache_resource
+def usage_ledger():
+    """Process-wide token/cost/latency ledger, also served on METRICS_PORT"""
+    ledger = UsageLedger(MODEL_PRICES)
+    if METRICS_PORT:
+        try:
+            serve_metrics(ledger, host=METRICS_HOST, port=METRICS_PORT)
+        except OSError as e:
+            logging.warning(f"Metrics endpoint not started on port {METRICS_PORT}: {e}")
+    return ledger
+
+def record_usage(kind, model, response, started, session=None):
+    """Add one finished call to the ledger (and its tokens to the current span)"""
+    prompt_tokens, completion_tokens = usage_of(response)
+    usage_ledger().record(session or current_session.get(), kind, model,
+                          prompt_tokens, completion_tokens, time.perf_counter() - started)
+    if current_span():
+        current_span().set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+def complete(kind, **kwargs):
+    """chat.create, hedged against slow responses when HEDGE_ENABLED"""
+    with tracer.span(f"llm.{kind}", model=kwargs["model"]):
+        started = time.perf_counter()
+        if hedger:
+            # The losing attempt was still paid for
+            session = current_session.get()
+            response = hedger.call(kind, chat.create, **kwargs, on_discard=lambda r: record_usage(
+                f"{kind}.discarded", kwargs["model"], r, started, session=session))
+        else:
+            response = chat.create(**kwargs)
+        record_usage(kind, kwargs["model"], response, started)
+        return response
+
+@st.cache_resource
+def emotion_flight():
+    """Process-wide coalescing of identical in-flight classifications"""
+    return SingleFlight()
+
+def detect_emotion(text, deadline=None):
+    # Identical messages from any session classified at the same moment
+    # share one cache lookup / API request
+    with tracer.span("emotion.detect") as span:
+        emotion = emotion_flight().do(normalize(text), classify_emotion, text, deadline)
+        span.set(emotion=emotion, source=span.attributes.get("source", "coalesced"))
+        return emotion
+
+@st.cache_resource
+def logprob_classifier():
+    """Single-token classifier, None in "text" mode or when tiktoken is unavailable"""
+    if CLASSIFY_METHOD != "logprobs":
+        return None
+    # for_model logs why when it returns None
+    return LogprobClassifier.for_model(CLASSIFIER_MODEL, EMOTIONS)
+
+@st.cache_resource
+def emotion_distributions():
+    """Distributions of recently classified messages, keyed like the emotion cache"""
+    return RecentDistributions()
+
+def classify_emotion(text, deadline=None):
+    span = current_span()
+    cached = emotion_cache().get(text)
+    if cached:
+        span.set(source="cache")
+        return cached
+    # Confident local predictions skip the network round trip entirely
+    local = local_classifier()
+    emotion = local.classify(text) if local else None
+    if emotion:
+        span.set(source="local")
+        return emotion
+    span.set(source="llm")
+    logprobs = logprob_classifier()
+    if logprobs:
+        return classify_distribution(text, logprobs, deadline)
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = complete(
+            "classify",
+            deadline=call_deadline(deadline, CLASSIFY_TIMEOUT),
+            model=CLASSIFIER_MODEL,
             messages=[{
                 "role": "system",
                 "content": f"Classify the dominant emotion from: {', '.join(EMOTIONS)}. Return ONLY the emotion name."
@@ -86,35 +324,203 @@ def detect_emotion(text):
             max_tokens=15
         )
         emotion = response.choices[0].message.content.lower().strip()
-        return emotion if emotion in EMOTIONS else "neutral"
+        emotion = emotion if emotion in EMOTIONS else "neutral"
+        emotion_cache().put(text, emotion)
+        return emotion
     except Exception:
         return "neutral"
 
+def classify_distribution(text, logprobs, deadline=None):
+    """Label ``text`` with one biased token and keep the distribution over EMOTIONS"""
+    try:
+        response = complete(
+            "classify",
+            deadline=call_deadline(deadline, CLASSIFY_TIMEOUT),
+            model=CLASSIFIER_MODEL,
+            messages=[{
+                "role": "system",
+                "content": f"Classify the dominant emotion from: {', '.join(EMOTIONS)}. {logprobs.instructions()}"
+            }, {
+                "role": "user",
+                "content": text
+            }],
+            temperature=0,
+            **logprobs.request_kwargs()
+        )
+        probs = logprobs.distribution(response)
+    except Exception:
+        return "neutral"
+    emotion = max(probs, key=probs.get)
+    emotion_distributions().put(normalize(text), probs)
+    emotion_cache().put(text, emotion)
+    return emotion
+
+def memory_index():
+    """Per-session retrieval index over everything remember_everything() stored"""
+    if "memory_index" not in st.session_state:
+        index = MemoryIndex()
+        for i, m in enumerate(st.session_state.messages, loaded_from()):
+            if m["role"] == "user":
+                index.add(i, m["content"])
+        st.session_state.memory_index = index
+    return st.session_state.memory_index
+
+@st.cache_resource
+def transcript_log():
+    """Process-wide append-only log of every message, None when switched off"""
+    if not TRANSCRIPT_DIR:
+        return None
+    return TranscriptLog(TRANSCRIPT_DIR, TRANSCRIPT_SEGMENT_BYTES, TRANSCRIPT_FSYNC_SECONDS)
+
+def add_message(message):
+    """Append a message to the chat, the session store and the durable transcript log"""
+    if session_store():
+        session_store().append(st.session_state.session_id, message)
+    st.session_state.messages.append(message)
+    if transcript_log():
+        transcript_log().append(st.session_state.session_id, message)
+
 def remember_everything(user_input):
     """Store every user message exactly as-is"""
     st.session_state.conversation_context.append(user_input)
+    # Keyed by the position the message is about to take in the chat
+    memory_index().add(loaded_from() + len(st.session_state.messages), user_input)
 
-def generate_response(user_input, emotion):
-    try:
-        # Use ALL previous messages as context
-        full_history = "\n".join(
-            f"{m['role'].capitalize()}: {m['content']}"
-            for m in st.session_state.messages
+FALLBACK_REPLY = "I appreciate you sharing. Could you tell me more?"
+
+# Structured output for single-call turns: emotion label + therapist reply
+TURN_SCHEMA = {
+    "name": "therapist_turn",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "emotion": {"type": "string", "enum": EMOTIONS},
+            "reply": {"type": "string"}
+        },
+        "required": ["emotion", "reply"],
+        "additionalProperties": False
+    }
+}
+
+@st.cache_resource
+def token_counter():
+    return TokenCounter("gpt-3.5-turbo")
+
+def history_builder():
+    """Per-session builder for the budgeted conversation history"""
+    if "history_builder" not in st.session_state:
+        st.session_state.history_builder = ContextBuilder(
+            HISTORY_TOKEN_BUDGET, token_counter(),
+            render=lambda m: f"{m['role'].capitalize()}: {m['content']}"
+        )
+    return st.session_state.history_builder
+
+def recall(user_input, before):
+    """Earlier user messages most relevant to ``user_input``, oldest first.
+
+    Only messages from before the history window (position < ``before``)
+    are recalled, so nothing is sent twice.
+    """
+    recalled, used = [], 0
+    for key, text in memory_index().search(user_input, k=MEMORY_TOP_K, before=before):
+        tokens = token_counter().count(text) + 2
+        if used + tokens > MEMORY_TOKEN_BUDGET:
+            break
+        recalled.append((key, text))
+        used += tokens
+    return "\n".join(f"- {text}" for key, text in sorted(recalled))
+
+def rolling_summary():
+    if "rolling_summary" not in st.session_state:
+        st.session_state.rolling_summary = RollingSummary(
+            SUMMARY_KEEP_RECENT, SUMMARY_BLOCK, on_fold=partial(save_summary, st.session_state.session_id)
         )
-        
-        response = client.chat.completions.create(
+    return st.session_state.rolling_summary
+
+
+@st.cache_resource
+def summary_pool():
+    """Background workers that fold old turns into the rolling summaries"""
+    return ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+
+@st.cache_resource
+def export_queue():
+    """Background workers that write (and upload) session exports"""
+    upload = s3_uploader(EXPORT_S3_BUCKET, EXPORT_S3_PREFIX) if EXPORT_S3_BUCKET else None
+    return ExportQueue(EXPORT_DIR, upload, workers=EXPORT_WORKERS, retries=EXPORT_RETRIES)
+
+@st.fragment(run_every=EXPORT_POLL_SECONDS)
+def export_watcher():
+    """Polls while this session has exports in flight, then reruns the app to announce them"""
+    if not export_queue().pending(st.session_state.session_id):
+        st.rerun()
+
+def summarize_block(previous_summary, block, session=None):
+    """Fold one block of messages into the running summary (runs on a worker)"""
+    transcript = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in block)
+    with tracer.span("llm.summary", model="gpt-3.5-turbo", messages=len(block)):
+        started = time.perf_counter()
+        response = chat.create(
+            deadline=call_deadline(None, RESPONSE_TIMEOUT),
             model="gpt-3.5-turbo",
             messages=[{
                 "role": "system",
-                "content": f"""You're an empathetic pyschologist or therapist with perfect memory. Act like a personal friend or guide to help people in different mental phases of life. Rules:
+                "content": """Update the running summary of a therapy conversation with the new messages.
+Keep every important fact: names, relationships, events, emotional triggers and preferences.
+Return ONLY the updated summary, at most 200 words."""
+            }, {
+                "role": "user",
+                "content": f"Current summary:\n{previous_summary or 'None'}\n\nNew messages:\n{transcript}"
+            }],
+            temperature=0.2,
+            max_tokens=300
+        )
+        record_usage("summary", "gpt-3.5-turbo", response, started, session)
+    return response.choices[0].message.content.strip()
+
+def therapist_prompt(user_input, emotion_rule):
+    """System prompt shared by the single-call and two-call paths"""
+    # Older turns come from the rolling summary, then as many of the
+    # remaining messages as fit in the budget, newest first
+    span = tracer.start_span("context.build")
+    builder = history_builder()
+    summary, summarised = rolling_summary().snapshot()
+    full_history = builder.build(st.session_state.messages, start=max(summarised - loaded_from(), 0))
+    if summary:
+        full_history = f"Summary of earlier conversation: {summary}\n{full_history}"
+    remembered = recall(user_input, before=loaded_from() + builder.report["start"])
+    if builder.report["dropped"]:
+        logging.info(f"History over budget: {builder.report}")
+    prompt = f"""You're an empathetic pyschologist or therapist with perfect memory. Act like a personal friend or guide to help people in different mental phases of life. Rules:
 1. FULL CONVERSATION HISTORY:
 {full_history}
 
-2. Remembered Details:
-{st.session_state.conversation_context}
+2. Remembered Details (earlier things the user said):
+{remembered or "None"}
 
-3. Current emotion: {emotion}
+3. {emotion_rule}
 4. Respond in 2-3 sentences, referencing relevant history"""
+    st.session_state.prompt_tokens = token_counter().count(prompt)
+    span.set(prompt_tokens=st.session_state.prompt_tokens, kept=builder.report["kept"],
+             dropped=builder.report["dropped"], summarised=builder.report["summarised"]).end()
+    return prompt
+
+def emotion_rule(emotion):
+    if emotion is None:
+        return "Current emotion: infer it from the user's latest message"
+    return f"Current emotion: {emotion}"
+
+def request_reply(system_prompt, user_input, deadline=None):
+    """Therapist reply for an already-built system prompt (safe off the script thread)"""
+    try:
+        response = complete(
+            "respond",
+            deadline=call_deadline(deadline, RESPONSE_TIMEOUT),
+            model="gpt-3.5-turbo",
+            messages=[{
+                "role": "system",
+                "content": system_prompt
             }, {
                 "role": "user",
                 "content": user_input
@@ -124,7 +530,111 @@ def generate_response(user_input, emotion):
         )
         return response.choices[0].message.content
     except Exception:
-        return "I appreciate you sharing. Could you tell me more?"
+        return FALLBACK_REPLY
+
+def stream_response(system_prompt, user_input, deadline=None):
+    """Yield the therapist reply token by token as the model produces it"""
+    started = time.perf_counter()
+    streamed = False
+    with tracer.span("llm.respond", model="gpt-3.5-turbo", stream=True) as span:
+        try:
+            stream = chat.create(
+                deadline=call_deadline(deadline, RESPONSE_TIMEOUT),
+                model="gpt-3.5-turbo",
+                messages=[{
+                    "role": "system",
+                    "content": system_prompt
+                }, {
+                    "role": "user",
+                    "content": user_input
+                }],
+                temperature=0.7,
+                max_tokens=250,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if chunk.usage:
+                    # The last chunk carries the usage of the whole stream
+                    record_usage("respond", "gpt-3.5-turbo", chunk, started)
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    if not streamed:
+                        ttft = time.perf_counter() - started
+                        span.set(ttft_ms=round(ttft * 1000, 3))
+                        logging.info(f"Time to first token {ttft:.2f}s")
+                    streamed = True
+                    yield token
+        except Exception as e:
+            span.status = "error"
+            span.set(error=type(e).__name__)
+            # Keep whatever already reached the user, only fall back on an empty reply
+            if not streamed:
+                yield FALLBACK_REPLY
+
+def detect_and_respond(user_input, deadline=None):
+    """Classify the emotion and write the reply in one structured call"""
+    try:
+        response = complete(
+            "single_call",
+            deadline=call_deadline(deadline, RESPONSE_TIMEOUT),
+            model=SINGLE_CALL_MODEL,
+            messages=[{
+                "role": "system",
+                "content": therapist_prompt(
+                    user_input,
+                    f"Classify the user's dominant emotion as exactly one of: {', '.join(EMOTIONS)}. "
+                    "Put it in 'emotion' and write your reply for that emotion in 'reply'"
+                )
+            }, {
+                "role": "user",
+                "content": user_input
+            }],
+            response_format={"type": "json_schema", "json_schema": TURN_SCHEMA},
+            temperature=0.7,
+            max_tokens=300
+        )
+        turn = json.loads(response.choices[0].message.content)
+        emotion = str(turn.get("emotion", "")).lower().strip()
+        reply = turn.get("reply") or FALLBACK_REPLY
+        return (emotion if emotion in EMOTIONS else "neutral"), reply
+    except Exception:
+        return "neutral", FALLBACK_REPLY
+
+@st.cache_resource
+def turn_pipeline():
+    """Process-wide pipeline (thread pool + reconcile counters) for concurrent mode"""
+    return ConcurrentTurnPipeline(policy=RECONCILE_POLICY, max_workers=TURN_WORKERS)
+
+def streamed_reply(system_prompt, user_input, deadline=None):
+    """Render this turn right away and stream the reply into it; the history
+    is only updated once the turn has finished"""
+    with st.chat_message("user", avatar="🧑"):
+        st.write(user_input)
+    with st.chat_message("assistant", avatar="🤖"):
+        return st.write_stream(stream_response(system_prompt, user_input, deadline))
+
+def concurrent_turn(user_input, deadline=None, stream=False):
+    """Generate (or stream) the reply while the emotion is still being classified"""
+    guess = st.session_state.emotion_history[-1] if st.session_state.emotion_history else None
+    return turn_pipeline().run(
+        user_input,
+        classify=partial(detect_emotion, deadline=deadline),
+        respond=partial(streamed_reply if stream else request_reply, deadline=deadline),
+        prompt_for=lambda e: therapist_prompt(user_input, emotion_rule(e)),
+        guess=guess
+    )
+
+def emotion_probs(text, emotion):
+    """The distribution ``emotion`` was picked from, if the classifier produced one"""
+    probs = emotion_distributions().get(normalize(text))
+    return probs if probs and max(probs, key=probs.get) == emotion else None
+
+def emotion_shares():
+    """Emotion totals over the session, counting each message's full distribution when it has one"""
+    # The track holds every turn since the reset, not only the loaded messages
+    shares = pd.Series(emotion_track().probs.sum(axis=0, dtype=float), index=emotion_track().labels)
+    return shares[shares > 0].sort_values(ascending=False)
 
 # Main layout
 st.title("🧠 EmoGenie Pro")
@@ -133,6 +643,67 @@ st.caption("Your AI powered Mental Health Buddy")
 # Create the sidebar (left panel)
 with st.sidebar:
     #st.header("Conversation Memory")
+    st.radio("Turn mode", TURN_MODES, key="turn_mode", horizontal=True,
+             help="single_call: one structured request per turn, two_call: detect emotion then stream the reply, "
+                  "concurrent: detect emotion while the reply is streamed")
+    if session_store():
+        with st.expander("💾 Session"):
+            st.caption(f"Session ID: `{st.session_state.session_id}`. "
+                       "Reopen this page's URL, or paste the ID below, to pick up where you left off.")
+            st.text_input("Resume session", key="resume_id", placeholder="session ID")
+            st.button("Resume", on_click=resume_requested)
+    if st.session_state.turn_mode == "concurrent":
+        stats = turn_pipeline().stats()
+        st.caption(f"Concurrent turns: {stats['turns']} | reconciled: {stats['mismatches']}"
+                   f" ({stats['mismatch_rate']:.0%} of guesses) | regenerated: {stats['regenerations']}")
+    
+    chat_stats = chat.stats()
+    st.caption(f"OpenAI: breaker {chat_stats['breaker']} | {chat_stats['calls']} calls, "
+               f"{chat_stats['retries']} retries, {chat_stats['failures']} failed, "
+               f"{chat_stats['short_circuited']} failed fast")
+    limiter_stats = chat.limiter.stats()
+    st.caption(f"Rate limiter: {limiter_stats['queued']} waiting | queue wait "
+               f"p50 {limiter_stats['wait_p50'] * 1000:.0f} ms, p95 {limiter_stats['wait_p95'] * 1000:.0f} ms")
+    if hedger:
+        hedging = hedger.report()
+        discarded = sum(row["cost"] for (kind, model), row in usage_ledger().process().items()
+                        if kind.endswith(".discarded"))
+        st.caption(f"Hedging: {hedging['extra_requests']:.1%} extra requests (${discarded:.4f} discarded), "
+                   f"{hedging['hedge_wins']} won")
+        for kind, p in hedging["kinds"].items():
+            if p["primary_p99"] is not None:
+                st.caption(f"{kind}: p50 {p['primary_p50']:.2f}s → {p['observed_p50']:.2f}s, "
+                           f"p95 {p['primary_p95']:.2f}s → {p['observed_p95']:.2f}s, "
+                           f"p99 {p['primary_p99']:.2f}s → {p['observed_p99']:.2f}s")
+    cache_stats = emotion_cache().stats()
+    st.caption(f"Emotion cache: {cache_stats['hit_rate']:.0%} hits "
+               f"({cache_stats['memory_hits']} memory, {cache_stats['disk_hits']} disk, "
+               f"{cache_stats['misses']} misses) | {emotion_flight().stats()['coalesced']} coalesced")
+    if "history_builder" in st.session_state:
+        report = st.session_state.history_builder.report
+        st.caption(f"Context: {report['kept']} messages sent, {report['summarised']} summarised, "
+                   f"{report['dropped']} dropped | prompt {st.session_state.get('prompt_tokens', 0)} tokens/turn")
+    if local_classifier():
+        local_stats = local_classifier().stats()
+        st.caption(f"Local classifier: {local_stats['local_rate']:.0%} answered locally "
+                   f"({local_stats['deferred']} sent to the LLM)")
+    
+    with st.expander("📊 Usage"):
+        session_usage = usage_ledger().session(st.session_state.session_id)
+        if session_usage:
+            usage_df = pd.DataFrame.from_dict(session_usage, orient="index")
+            usage_df["latency"] = usage_df["latency"] / usage_df["calls"]
+            usage_df.columns = ["Calls", "Prompt tokens", "Completion tokens", "Cost ($)", "Avg latency (s)"]
+            st.dataframe(usage_df, use_container_width=True)
+            session_total = UsageLedger.total(session_usage)
+            turns = max(1, sum(m["role"] == "user" for m in st.session_state.messages))
+            st.caption(f"This session: ${session_total['cost']:.4f}, "
+                       f"{(session_total['prompt_tokens'] + session_total['completion_tokens']) / turns:.0f} tokens/turn")
+        process_total = UsageLedger.total(usage_ledger().process())
+        st.caption(f"Process: {process_total['calls']} calls, {process_total['prompt_tokens']} prompt + "
+                   f"{process_total['completion_tokens']} completion tokens, ${process_total['cost']:.4f}")
+        st.caption(f"Handled locally: {st.session_state.get('calls_saved', 0)} calls saved this session, "
+                   f"{sum(usage_ledger().saved().values())} in this process")
     
     with st.expander(f"🧠 Chat History ({len(st.session_state.conversation_context)})"):
         if st.session_state.conversation_context:
@@ -158,10 +729,12 @@ with st.sidebar_right:
     st.metric("EQ Score", f"{st.session_state.eq_score}/100", 
              delta=f"{st.session_state.eq_score-50:+d} from neutral")
     st.progress(st.session_state.eq_score/100)
+    if len(emotion_track()) > 1:
+        st.line_chart(eq_trajectory(), height=120)
     
     # Mini pie chart
     if st.session_state.emotion_history:
-        emotion_counts = pd.Series(st.session_state.emotion_history).value_counts()
+        emotion_counts = emotion_shares()
         fig = px.pie(
             names=emotion_counts.index,
             values=emotion_counts.values,
@@ -181,6 +754,19 @@ with st.sidebar_right:
 
 # Main chat area
 st.subheader("Therapy Session")
+# Announce finished exports, and keep polling while any are still being written
+for job in export_queue().finished(st.session_state.session_id):
+    if job.error:
+        st.toast(f"Couldn't save {job.filename}: {job.error}", icon="⚠️")
+    else:
+        st.toast(f"Chat history saved to {job.location}", icon="💾")
+if export_queue().pending(st.session_state.session_id):
+    export_watcher()
+
+if st.session_state.message_offset > st.session_state.chat_start:
+    st.button(f"Load older messages ({st.session_state.message_offset - st.session_state.chat_start} more)",
+              on_click=load_older_messages)
+
 for msg in st.session_state.messages:
     avatar = "🧑" if msg["role"] == "user" else "🤖"
     with st.chat_message(msg["role"], avatar=avatar):
@@ -195,61 +781,149 @@ for msg in st.session_state.messages:
             }.get(msg["emotion"], "❓")
             st.caption(f"{emoji} {msg['emotion'].capitalize()}")
 
+# Commands and trivial inputs are answered before any LLM call
+router = CommandRouter(ACKNOWLEDGEMENTS)
+
+# LLM calls a normal turn makes in each mode, i.e. what a trivial input saves
+TURN_CALLS = {"single_call": 1, "two_call": 2, "concurrent": 2}
+
+@router.command("/export")
+def export_chat():
+    """Queue the conversation so far for a background CSV export of
+    user/bot pairs; a toast announces it once written"""
+    messages = st.session_state.messages
+    if session_store() and st.session_state.message_offset > st.session_state.chat_start:
+        # Include the messages a resume didn't load
+        older, _ = session_store().older(st.session_state.session_id, st.session_state.message_offset,
+                                         st.session_state.message_offset - st.session_state.chat_start,
+                                         st.session_state.chat_start)
+        messages = older + messages
+    if any(m["role"] == "assistant" for m in messages):
+        export_queue().submit(st.session_state.session_id, messages)
+
+@router.command("/reset")
+def reset_chat():
+    """Clear the chat and everything derived from it"""
+    if transcript_log():
+        transcript_log().append(st.session_state.session_id, {"event": "reset"})
+    # The stored session keeps its messages, a resume starts after them.
+    # Nothing before this point is loadable any more
+    st.session_state.chat_start = st.session_state.message_offset = 0
+    if session_store():
+        session_store().reset(st.session_state.session_id)
+        session_store().save(st.session_state.session_id, eq_score=EQ_START, summary=None, summary_upto=0)
+    st.session_state.messages = []
+    st.session_state.emotion_history = []
+    st.session_state.conversation_context = []
+    st.session_state.eq_score = EQ_START
+    st.session_state.pop("emotion_track", None)
+    st.session_state.pop("eq_trajectory", None)
+    if "rolling_summary" in st.session_state:
+        # A fold still running must not save the old chat's summary over the reset
+        st.session_state.rolling_summary.on_fold = None
+    st.session_state.pop("rolling_summary", None)
+    st.session_state.pop("memory_index", None)
+
+@router.command("quit", "/quit")
+def quit_chat():
+    export_chat()
+    reset_chat()
+
+def handle_locally(prompt, route):
+    """Answer a routed input without classifying it, scoring it with an LLM
+    label or adding it to memory"""
+    # Commands were classified before the quit check, trivial inputs took a full turn
+    saved = 1 if route.kind == "command" else TURN_CALLS[st.session_state.turn_mode]
+    usage_ledger().record_saved(route.name, saved)
+    st.session_state.calls_saved = st.session_state.get("calls_saved", 0) + saved
+    current_span().set(route=route.name, calls_saved=saved)
+    if route.kind == "command":
+        route.handler()
+    elif route.name in TRIVIAL_REPLIES:
+        with tracer.span("eq.update"):
+            update_eq_score(route.emotion)
+        with tracer.span("state.update"):
+            now = datetime.now().strftime("%H:%M")
+            add_message({"role": "user", "content": prompt, "emotion": route.emotion, "time": now})
+            add_message({"role": "assistant", "content": TRIVIAL_REPLIES[route.name], "time": now})
+            st.session_state.emotion_history.append(route.emotion)
+
 # Chat input
 if prompt := st.chat_input("How are you feeling today?"):
-    # Detect emotion and update EQ
-    emotion = detect_emotion(prompt)
-    update_eq_score(emotion)
-    remember_everything(prompt)
+    turn_start = time.perf_counter()
+    turn_deadline = time.monotonic() + TURN_LATENCY_BUDGET
+    response = None
+    # A full session id is enough to resume the chat, traces only get the export filename prefix
+    turn_span = tracer.start_span("turn", mode=st.session_state.turn_mode, session=st.session_state.session_id[:8])
+    set_current_span(turn_span)
+
+    route = router.route(prompt)
+    if route:
+        handle_locally(prompt, route)
+        logging.info(f"Turn mode={st.session_state.turn_mode} route={route.name} "
+                     f"latency={time.perf_counter() - turn_start:.2f}s trace={turn_span.trace_id}")
+        st.session_state.pending_turn = turn_span
+        st.rerun()
+
+    # Detect emotion (and reply, in single-call mode) and update EQ
+    if st.session_state.turn_mode == "single_call":
+        with st.spinner("Thinking..."):
+            emotion, response = detect_and_respond(prompt, turn_deadline)
+    elif st.session_state.turn_mode == "concurrent" and STREAM_RESPONSES and RECONCILE_POLICY == "accept":
+        # The guessed reply is the one kept, so it can be streamed as it is written
+        emotion, response = concurrent_turn(prompt, turn_deadline, stream=True)
+    elif st.session_state.turn_mode == "concurrent":
+        with st.spinner("Thinking..."):
+            emotion, response = concurrent_turn(prompt, turn_deadline)
+    else:
+        emotion = detect_emotion(prompt, turn_deadline)
+    probs = emotion_probs(prompt, emotion)
+    with tracer.span("eq.update"):
+        update_eq_score(emotion, probs)
+    # Two-call turns build the reply prompt before this message joins the
+    # history, like single-call and concurrent turns do
+    system_prompt = therapist_prompt(prompt, emotion_rule(emotion)) if response is None else None
     
     # Store message
-    st.session_state.messages.append({
-        "role": "user",
-        "content": prompt,
-        "emotion": emotion,
-        "time": datetime.now().strftime("%H:%M")
-    })
-    st.session_state.emotion_history.append(emotion)
+    with tracer.span("state.update"):
+        remember_everything(prompt)
+        add_message({
+            "role": "user",
+            "content": prompt,
+            "emotion": emotion,
+            "time": datetime.now().strftime("%H:%M"),
+            **({"emotion_probs": probs} if probs else {})
+        })
+        st.session_state.emotion_history.append(emotion)
+    turn_span.set(emotion=emotion)
     
-    # Check for quit command
-    if prompt.lower().strip() == "quit":
-        # Prepare chat history for CSV
-        chat_history = []
-        for i in range(0, len(st.session_state.messages)-1, 2):
-            if (i+1) < len(st.session_state.messages):
-                user_msg = st.session_state.messages[i]
-                bot_msg = st.session_state.messages[i+1]
-                if user_msg["role"] == "user" and bot_msg["role"] == "assistant":
-                    chat_history.append({
-                        "User_msg": user_msg["content"],
-                        "Bot_msg": bot_msg["content"],
-                        "emotion": user_msg.get("emotion", "unknown")
-                    })
-        
-        # Create DataFrame and save to CSV
-        if chat_history:
-            df = pd.DataFrame(chat_history)
-            csv_filename = f"emogenie_chat{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            df.to_csv(csv_filename, index=False)
-            st.toast(f"Chat history saved to {csv_filename}", icon="💾")
-        
-        # Clear the chat (optional)
-        st.session_state.messages = []
-        st.session_state.emotion_history = []
-        st.session_state.conversation_context = []
-        st.session_state.eq_score = 50
-        st.rerun()
-    else:
-        # Generate response (only if not quitting)
+    # Generate response
+    if response is None and STREAM_RESPONSES:
+        response = streamed_reply(system_prompt, prompt, turn_deadline)
+    elif response is None:
         with st.spinner("Thinking..."):
-            response = generate_response(prompt, emotion)
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": response,
-                "time": datetime.now().strftime("%H:%M")
-            })
-        
-        st.rerun()
+            response = request_reply(system_prompt, prompt, turn_deadline)
+    with tracer.span("state.update"):
+        add_message({
+            "role": "assistant",
+            "content": response,
+            "time": datetime.now().strftime("%H:%M")
+        })
+    logging.info(f"Turn mode={st.session_state.turn_mode} emotion={emotion} "
+                 f"latency={time.perf_counter() - turn_start:.2f}s "
+                 f"prompt_tokens={st.session_state.get('prompt_tokens', 0)} trace={turn_span.trace_id}")
+    # The reply is already on screen, fold old turns in the background
+    rolling_summary().schedule(summary_pool(), st.session_state.messages,
+                               partial(summarize_block, session=st.session_state.session_id),
+                               offset=loaded_from())
+    
+    st.session_state.pending_turn = turn_span
+    st.rerun()
+
+# This run rendered the previous turn's result, which completes that turn
+if render_span:
+    render_span.end()
+    pending_turn.end()
 
 ### perfection with all advanced features & csv file creation & AWS SECRET MANAGER (TESTING LEFT)
 
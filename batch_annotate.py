@@ -0,0 +1,238 @@
+"""Offline emotion annotation of exported transcripts.
+
+    python batch_annotate.py emogenie_chat*.csv
+    python batch_annotate.py archive/*.csv --column text --batch-size 100 --concurrency 16
+
+Every file gets a ``<name>.annotated.csv`` copy with an extra label column
+(``--label-column emotion`` overwrites the original labels instead). Messages
+are de-duplicated, packed ``--batch-size`` to a request with numbered ids and
+labelled from the EMOTIONS taxonomy in one structured (json_schema) response
+per batch. Batches run ``--concurrency`` at a time through the shared client,
+so retries, the circuit breaker and the rate limiter apply. A batch that fails
+(e.g. a response cut off at max_tokens) is split in half for the next pass.
+Finished batches are appended to a checkpoint; rerunning the same command
+resumes from it.
+"""
+import argparse
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from config import EMOTIONS, ANNOTATE_MODEL, ANNOTATE_BATCH_SIZE, ANNOTATE_MAX_CHARS, ANNOTATE_CONCURRENCY
+from emotion_cache import namespace, normalize
+from llm_client import get_completions
+from rate_limiter import current_session
+
+BATCH_SCHEMA = {
+    "name": "emotion_annotations",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "labels": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer"},
+                        "emotion": {"type": "string", "enum": EMOTIONS}
+                    },
+                    "required": ["id", "emotion"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["labels"],
+        "additionalProperties": False
+    }
+}
+
+# Output budget per message: {"id":123,"emotion":"frustration"}, is ~12 tokens,
+# so this leaves room for whitespace and longer ids
+TOKENS_PER_LABEL = 20
+
+SYSTEM_PROMPT = (f"Classify the dominant emotion of every message as exactly one of: {', '.join(EMOTIONS)}. "
+                 "The messages are a JSON list of {id, text}. Return one label per id.")
+
+
+class TruncatedResponse(Exception):
+    """The response hit max_tokens before its JSON was complete"""
+
+
+class Checkpoint:
+    """Append-only JSONL of finished labels, keyed by normalized message text"""
+
+    def __init__(self, path, model):
+        self.path = path
+        self.namespace = namespace(model, EMOTIONS)
+        self.labels = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                header, *lines = f.read().split(b"\n")
+                if json.loads(header or b"{}").get("namespace") != self.namespace:
+                    raise SystemExit(f"{path} was written for another model or label set, remove it to start over")
+                good = len(header) + 1
+                for line in lines:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self.labels[entry["key"]] = entry["emotion"]
+                    good += len(line) + 1
+                # Drop a line torn by an interrupted run so appends start clean
+                f.truncate(good)
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write(json.dumps({"namespace": self.namespace, "model": model}) + "\n")
+            self._file.flush()
+
+    def add(self, labels):
+        lines = "".join(json.dumps({"key": k, "emotion": e}) + "\n" for k, e in labels.items())
+        with self._lock:
+            self.labels.update(labels)
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def pack(items, batch_size, max_chars):
+    """Split (key, text) pairs into batches of at most ``batch_size`` messages / ``max_chars`` characters"""
+    batches, batch, chars = [], [], 0
+    for key, text in items:
+        if batch and (len(batch) == batch_size or chars + len(text) > max_chars):
+            batches.append(batch)
+            batch, chars = [], 0
+        batch.append((key, text))
+        chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def annotate_batch(chat, model, batch):
+    """{key: emotion} for one packed batch; ids the model skipped are left out"""
+    payload = [{"id": i, "text": text} for i, (key, text) in enumerate(batch, 1)]
+    response = chat.create(
+        model=model,
+        messages=[{
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        }, {
+            "role": "user",
+            "content": json.dumps(payload, ensure_ascii=False)
+        }],
+        response_format={"type": "json_schema", "json_schema": BATCH_SCHEMA},
+        temperature=0,
+        max_tokens=TOKENS_PER_LABEL * len(batch) + 20
+    )
+    if response.choices[0].finish_reason == "length":
+        raise TruncatedResponse(f"{len(batch)} labels did not fit in {TOKENS_PER_LABEL * len(batch) + 20} tokens")
+    labels = {}
+    for item in json.loads(response.choices[0].message.content)["labels"]:
+        if 1 <= item.get("id", 0) <= len(batch) and item.get("emotion") in EMOTIONS:
+            labels[batch[item["id"] - 1][0]] = item["emotion"]
+    return labels
+
+
+def split(batch):
+    """A failed batch as the halves it is retried in"""
+    middle = len(batch) // 2
+    return [batch[:middle], batch[middle:]] if middle else [batch]
+
+
+def annotate(texts, chat, checkpoint, model, batch_size, max_chars, concurrency, passes=2):
+    """Label every text not in the checkpoint yet. Messages a response left
+    out are repacked for a later pass, and failed batches are retried split
+    in half; returns (labelled now, still unlabelled)"""
+    unique = {}
+    for text in texts:
+        unique.setdefault(normalize(text), text)
+    started, done, failed = time.perf_counter(), 0, []
+    for attempt in range(passes):
+        todo = [(key, text) for key, text in unique.items() if key not in checkpoint.labels]
+        if not todo:
+            break
+        retried = {key for batch in failed for key, text in batch}
+        batches = [half for batch in failed for half in split(batch)]
+        batches += pack([item for item in todo if item[0] not in retried], batch_size, max_chars)
+        failed = []
+        print(f"pass {attempt + 1}: {len(todo)} messages in {len(batches)} requests")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {
+                pool.submit(contextvars.copy_context().run, annotate_batch, chat, model, batch): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                try:
+                    labels = future.result()
+                except Exception as e:
+                    print(f"  batch failed ({type(e).__name__}: {e}), will retry it split in half")
+                    failed.append(futures[future])
+                    continue
+                checkpoint.add(labels)
+                done += len(labels)
+                elapsed = time.perf_counter() - started
+                print(f"  {done} labelled, {done / elapsed * 60:,.0f} messages/min", end="\r")
+        print()
+    return done, sum(key not in checkpoint.labels for key in unique)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label exported transcripts with the EMOTIONS taxonomy")
+    parser.add_argument("csv", nargs="+", help="CSV files or glob patterns")
+    parser.add_argument("--column", default="User_msg", help="text column to classify")
+    parser.add_argument("--label-column", default="annotated_emotion", help="column the labels are written to")
+    parser.add_argument("--out-dir", help="where annotated copies go (default: next to each input)")
+    parser.add_argument("--checkpoint", default="annotations.checkpoint.jsonl")
+    parser.add_argument("--model", default=ANNOTATE_MODEL, help="must support json_schema structured outputs")
+    parser.add_argument("--batch-size", type=int, default=ANNOTATE_BATCH_SIZE, help="messages per request")
+    parser.add_argument("--max-chars", type=int, default=ANNOTATE_MAX_CHARS, help="characters per request")
+    parser.add_argument("--concurrency", type=int, default=ANNOTATE_CONCURRENCY, help="requests in flight")
+    args = parser.parse_args()
+    load_dotenv()
+
+    paths = sorted({p for pattern in args.csv for p in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit(f"No CSV files match {args.csv}")
+    frames = {path: pd.read_csv(path) for path in paths}
+    for path, df in frames.items():
+        if args.column not in df.columns:
+            raise SystemExit(f"{path} has no {args.column!r} column (columns: {', '.join(df.columns)})")
+    texts = [str(t) for df in frames.values() for t in df[args.column].dropna()]
+
+    # Batch requests queue fairly behind interactive sessions in the rate limiter
+    current_session.set("batch_annotate")
+    checkpoint = Checkpoint(args.checkpoint, args.model)
+    started = time.perf_counter()
+    try:
+        done, missing = annotate(texts, get_completions(), checkpoint, args.model,
+                           args.batch_size, args.max_chars, args.concurrency)
+    finally:
+        checkpoint.close()
+    elapsed = time.perf_counter() - started
+
+    for path, df in frames.items():
+        df[args.label_column] = [
+            checkpoint.labels.get(normalize(str(t))) if pd.notna(t) else None for t in df[args.column]
+        ]
+        out_dir = args.out_dir or os.path.dirname(path)
+        out = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".annotated.csv")
+        df.to_csv(out, index=False)
+        print(f"Wrote {out}")
+    print(f"{len(texts)} messages, {done} labelled in {elapsed:.1f}s ({done / max(elapsed, 1e-9) * 60:,.0f}/min)"
+          + (f", {missing} still unlabelled: rerun to retry them" if missing else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Per-turn connection overhead: a fresh OpenAI client per turn (what every
+Streamlit rerun used to do) vs the shared, pooled client from llm_client.
+
+    python -m benchmarks.client_pool --requests 50
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 python -m benchmarks.client_pool
+
+Each request is a 1-token chat completion, so the difference between the two
+runs is dominated by TCP + TLS setup.
+"""
+import argparse
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from llm_client import build_client, get_client
+
+
+def one_request(client, model):
+    started = time.perf_counter()
+    client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": "hi"}],
+        max_tokens=1
+    )
+    return time.perf_counter() - started
+
+
+def summarize(name, timings):
+    cuts = statistics.quantiles(timings, n=100)
+    print(f"{name:>8}: mean {statistics.mean(timings) * 1000:7.1f} ms  "
+          f"p50 {cuts[49] * 1000:7.1f} ms  p95 {cuts[94] * 1000:7.1f} ms")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    args = parser.parse_args()
+    load_dotenv()
+
+    fresh = []
+    for _ in range(args.requests):
+        client = build_client()
+        fresh.append(one_request(client, args.model))
+        client.close()
+
+    shared_client = get_client()
+    one_request(shared_client, args.model)  # warm the pool
+    shared = [one_request(shared_client, args.model) for _ in range(args.requests)]
+
+    fresh_mean = summarize("fresh", fresh)
+    shared_mean = summarize("shared", shared)
+    print(f"per-turn connection overhead saved: {(fresh_mean - shared_mean) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Concurrent-session load test: N simulated users driving the real app12
+turn flow (emotion detection, EQ update, reply, rerun) on one Streamlit server.
+
+    python -m benchmarks.load_test --users 1 10 50 200 --turns 5 --think-time 2
+    python -m benchmarks.load_test --users 100 --mode two_call --latency-median 0.8
+
+``streamlit run app12.py`` is started headless in a subprocess, exactly as a
+container runs it, and each simulated user is a websocket session speaking
+the browser's protocol: it sends a chat message, waits until the script
+(and the rerun it triggers) has finished, thinks for an exponentially
+distributed time and sends the next one. The LLM is a mock_llm_server in
+this process, which records how long each kind of call took.
+
+Each step reports turn throughput and p50/p95/p99 per stage:
+
+    turn      message sent -> final rerun finished, what the user waits for
+    script    the app's own turn latency (from its log), without the rerun
+    classify, respond, single_call, summary   LLM calls, as the mock served them
+
+plus the server process's CPU and memory. When ``turn`` grows much faster
+than ``script``, reruns are queueing for the interpreter.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.request import urlopen
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.Radio_pb2 import Radio
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from config import TURN_MODES, TURN_MODE
+from hedging import percentile
+from mock_llm_server import MockSettings, serve
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app12.py")
+
+OPENERS = ["Honestly", "Today", "Lately", "This week", "Right now", "Since yesterday", "Again"]
+FEELINGS = ["I feel anxious about", "I'm so happy about", "I'm frustrated with", "I feel sad about",
+            "I'm worried about", "I feel guilty about", "I'm excited about", "I'm angry about"]
+TOPICS = ["my job", "my exams", "my sister", "the move", "my health", "money", "my friends",
+          "the deadline", "my relationship", "sleeping badly"]
+
+TURN_LOG = re.compile(r"Turn mode=\S+ .*latency=([\d.]+)s")
+
+
+class Recorder:
+    """Thread-safe latency samples per stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = []
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def error(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+    def reset(self):
+        with self._lock:
+            self.samples = defaultdict(list)
+            self.errors = []
+
+
+class SessionClient:
+    """One browser tab: a websocket session on the Streamlit server"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.widget_ids = {}
+        self.widget_states = {}
+
+    async def rerun(self, *triggers):
+        """Rerun the script with the current widget values plus one-off ``triggers``
+        and wait until it (and any st.rerun it asked for) has finished"""
+        message = BackMsg()
+        message.rerun_script.widget_states.widgets.extend([*self.widget_states.values(), *triggers])
+        await self.connection.send(message.SerializeToString())
+        while True:
+            payload = await self.connection.recv()
+            forward = ForwardMsg()
+            forward.ParseFromString(payload)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    raise RuntimeError(element.exception.message)
+                if element_type in ("chat_input", "radio"):
+                    self.widget_ids[element_type] = getattr(element, element_type).id
+            elif kind == "script_finished":
+                status = forward.script_finished
+                if status == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("app12.py failed to compile")
+                if status != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+    async def set_mode(self, mode):
+        state = WidgetState(id=self.widget_ids["radio"])
+        if "raw_value" in Radio.DESCRIPTOR.fields_by_name:
+            state.string_value = mode
+        else:
+            # Older Streamlit sent the selected option's index
+            state.int_value = TURN_MODES.index(mode)
+        self.widget_states["radio"] = state
+        await self.rerun()
+
+    async def send(self, text):
+        state = WidgetState(id=self.widget_ids["chat_input"])
+        if "chat_input_value" in WidgetState.DESCRIPTOR.fields_by_name:
+            state.chat_input_value.data = text
+        else:
+            # Streamlit before 1.43 sent chat messages as a plain string trigger
+            state.string_trigger_value.data = text
+        await self.rerun(state)
+
+
+def message(rng):
+    return f"{rng.choice(OPENERS)} {rng.choice(FEELINGS)} {rng.choice(TOPICS)}."
+
+
+async def simulated_user(user, args, url, recorder):
+    rng = random.Random(args.seed * 100_003 + user)
+    try:
+        session = SessionClient(await websockets.connect(url, max_size=64 * 1024 * 1024))
+        await asyncio.wait_for(session.rerun(), args.timeout)
+        if args.mode != TURN_MODE:
+            await asyncio.wait_for(session.set_mode(args.mode), args.timeout)
+    except Exception as e:
+        recorder.error(f"user {user} could not start: {e!r}")
+        return
+    await asyncio.sleep(rng.uniform(0, args.think_time))  # don't start every user in lockstep
+    for _ in range(args.turns):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(session.send(message(rng)), args.timeout)
+        except Exception as e:
+            recorder.error(f"user {user}: {e!r}")
+            break
+        recorder.add("turn", time.perf_counter() - started)
+        await asyncio.sleep(rng.expovariate(1 / args.think_time) if args.think_time else 0)
+    await session.connection.close()
+
+
+def process_usage(pid):
+    """(CPU seconds used so far, current RSS in MB, peak RSS in MB) of a Linux process"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        memory = {}
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    memory[line.split(":")[0]] = int(line.split()[1]) / 1024
+        return cpu, memory.get("VmRSS", 0.0), memory.get("VmHWM", 0.0)
+    except OSError:
+        return None, None, None
+
+
+async def run_step(users, args, url, recorder, pid):
+    recorder.reset()
+    cpu_before, _, _ = process_usage(pid)
+    started = time.perf_counter()
+    await asyncio.gather(*(simulated_user(u, args, url, recorder) for u in range(users)))
+    elapsed = time.perf_counter() - started
+    cpu_after, rss, peak = process_usage(pid)
+    turns = len(recorder.samples["turn"])
+    return {
+        "users": users,
+        "turns": turns,
+        "errors": list(recorder.errors),
+        "elapsed": elapsed,
+        "throughput": turns / elapsed,
+        "cpu": None if cpu_before is None else (cpu_after - cpu_before) / elapsed,
+        "rss": rss,
+        "peak_rss": peak,
+        "stages": {stage: list(samples) for stage, samples in recorder.samples.items()},
+    }
+
+
+def print_step(result):
+    usage = ("CPU/memory n/a" if result["cpu"] is None else
+             f"CPU {result['cpu']:.0%} of a core | RSS {result['rss']:.0f} MB (peak {result['peak_rss']:.0f} MB)")
+    print(f"\n{result['users']} users: {result['turns']} turns in {result['elapsed']:.1f}s = "
+          f"{result['throughput']:.2f} turns/s | {usage}")
+    for stage in ("turn", "script", "classify", "respond", "single_call", "summary"):
+        samples = result["stages"].get(stage)
+        if samples:
+            print(f"  {stage:>11}: n={len(samples):<5} " + "  ".join(
+                f"p{p} {percentile(samples, p) * 1000:7.0f} ms" for p in (50, 95, 99)))
+    if result["errors"]:
+        print(f"  {len(result['errors'])} errors, e.g. {result['errors'][0]}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port, base_url, recorder):
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "mock"))
+    server = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", APP_PATH,
+        "--server.headless", "true",
+        "--server.port", str(port),
+        "--browser.gatherUsageStats", "false",
+    ], cwd=os.path.dirname(APP_PATH), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    def read_log():
+        # The app logs one line per finished turn; keep draining so it never blocks
+        for line in server.stderr:
+            match = TURN_LOG.search(line)
+            if match:
+                recorder.add("script", float(match.group(1)))
+
+    threading.Thread(target=read_log, daemon=True).start()
+    for _ in range(600):
+        try:
+            urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("streamlit exited during startup")
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("streamlit did not become healthy within 60s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50],
+                        help="concurrent sessions per step, e.g. 1 10 100 300")
+    parser.add_argument("--turns", type=int, default=5, help="messages each user sends")
+    parser.add_argument("--think-time", type=float, default=2.0, help="mean seconds between a user's turns")
+    parser.add_argument("--mode", choices=TURN_MODES, default=TURN_MODE)
+    parser.add_argument("--latency-median", type=float, default=0.5, help="mock's median time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="mock's output throughput")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock's injected 500 rate")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds a turn may take before it counts as failed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    mock_port, app_port = free_port(), free_port()
+    mock = serve(port=mock_port, settings=MockSettings(
+        args.latency_median, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+        seed=args.seed, observer=lambda kind, seconds, status: recorder.add(kind, seconds)
+    ))
+    app = start_app(app_port, f"http://127.0.0.1:{mock_port}/v1", recorder)
+    url = f"ws://127.0.0.1:{app_port}/_stcore/stream"
+    print(f"Load test: mode={args.mode}, {args.turns} turns/user, think time {args.think_time}s, "
+          f"mock latency {args.latency_median}s + {args.tokens_per_second:g} tokens/s")
+    try:
+        for users in args.users:
+            print_step(asyncio.run(run_step(users, args, url, recorder, app.pid)))
+    finally:
+        app.terminate()
+        app.wait()
+        mock.shutdown()
+
+
+if __name__ == "__main__":
+    main()
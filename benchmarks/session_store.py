@@ -0,0 +1,123 @@
+"""Session store latency at scale: turn appends and resumes against a database
+already holding ``--messages`` messages.
+
+    python -m benchmarks.session_store --messages 100000 --sessions 1000
+    python -m benchmarks.session_store --messages 1000000 --turns 2000
+
+Reports, with p50/p95/p99:
+
+    append         what a turn pays: two queued messages + an EQ update
+    commit         one background commit of the queued batch
+    sync turn      a turn committed on its own, for comparison with batching
+    resume         load(): session row, every user message, newest page
+    older page     the page before the loaded one
+    resume large   load() of one session holding ``--large`` messages
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from config import EMOTIONS, SESSION_PAGE
+from hedging import percentile
+from session_store import SessionStore
+
+TEXT = "I keep thinking about what happened at work today and I can't switch off. "
+
+
+def message(seq):
+    if seq % 2:
+        return {"role": "assistant", "content": TEXT * 3, "time": "12:00"}
+    emotion = EMOTIONS[seq % len(EMOTIONS)]
+    return {"role": "user", "content": TEXT, "emotion": emotion, "time": "12:00",
+            "emotion_probs": {emotion: 0.8, "neutral": 0.2}}
+
+
+def report(name, timings):
+    print(f"{name:>13}: p50 {percentile(timings, 50) * 1000:8.3f} ms  p95 {percentile(timings, 95) * 1000:8.3f} ms  "
+          f"p99 {percentile(timings, 99) * 1000:8.3f} ms  ({len(timings)} samples)")
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=100_000, help="messages stored before measuring")
+    parser.add_argument("--sessions", type=int, default=1000, help="sessions they are spread over")
+    parser.add_argument("--large", type=int, default=10_000, help="messages in the one large session")
+    parser.add_argument("--turns", type=int, default=1000, help="turns appended while measuring")
+    parser.add_argument("--page", type=int, default=SESSION_PAGE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    directory = tempfile.mkdtemp()
+    try:
+        # A commit interval this long leaves every commit to the explicit flush() calls below
+        store = SessionStore(os.path.join(directory, "sessions.sqlite3"), commit_interval=3600)
+        started = time.perf_counter()
+        per_session = (args.messages - args.large) // args.sessions
+        lengths = {f"s{i:05d}": per_session for i in range(args.sessions)}
+        lengths["large"] = args.large
+        for session, count in lengths.items():
+            for seq in range(count):
+                store.append(session, message(seq))
+            store.save(session, eq_score=50, turn_mode="two_call")
+        store.flush()
+        size = os.path.getsize(store.path) + os.path.getsize(store.path + "-wal")
+        print(f"Stored {sum(lengths.values())} messages in {len(lengths)} sessions in "
+              f"{time.perf_counter() - started:.1f}s ({size / 2**20:.0f} MiB)\n")
+
+        sessions = [s for s in lengths if s != "large"]
+        appends, commits, sync_turns = [], [], []
+        for turn in range(args.turns):
+            session = rng.choice(sessions)
+            seq = lengths[session]
+            lengths[session] += 2
+            started = time.perf_counter()
+            store.append(session, message(seq))
+            store.append(session, message(seq + 1))
+            store.save(session, eq_score=50 + turn % 10)
+            appends.append(time.perf_counter() - started)
+            # The background thread commits every SESSION_COMMIT_SECONDS, ~ every 10 turns under load
+            if turn % 10 == 9:
+                commits.append(timed(store.flush))
+        for turn in range(args.turns // 10):
+            session = rng.choice(sessions)
+            seq = lengths[session]
+            lengths[session] += 2
+            started = time.perf_counter()
+            store.append(session, message(seq))
+            store.append(session, message(seq + 1))
+            store.save(session, eq_score=50)
+            store.flush()
+            sync_turns.append(time.perf_counter() - started)
+
+        resumes, pages = [], []
+        for _ in range(args.turns // 5):
+            session = rng.choice(sessions)
+            started = time.perf_counter()
+            saved = store.load(session, args.page)
+            resumes.append(time.perf_counter() - started)
+            pages.append(timed(store.older, session, saved["offset"], args.page, saved["start"]))
+        large = [timed(store.load, "large", args.page) for _ in range(20)]
+
+        report("append", appends)
+        report("commit", commits)
+        report("sync turn", sync_turns)
+        report("resume", resumes)
+        report("older page", pages)
+        report("resume large", large)
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
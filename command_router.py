@@ -0,0 +1,77 @@
+"""Pre-dispatch routing of chat input.
+
+Runs before a turn touches the classifier, the EQ score or the memory
+index. Commands ("quit", "/export", ...) and trivial inputs (blank,
+emoji or punctuation only, a one-word acknowledgement) are recognised
+with string checks and handled locally; anything else routes to None
+and takes the normal LLM turn. New commands are registered with
+``@router.command("/name")``.
+"""
+import unicodedata
+from collections import Counter
+
+# Emoji a message made only of emoji is labelled with, without asking the classifier
+EMOJI_EMOTIONS = {
+    "😊": "happiness", "🙂": "happiness", "😀": "happiness", "😃": "happiness", "😄": "happiness",
+    "😂": "joy", "🤣": "joy", "😁": "joy", "🥳": "joy", "🎉": "joy",
+    "❤": "love", "❤️": "love", "😍": "love", "🥰": "love", "😘": "love", "💕": "love",
+    "😲": "surprise", "😮": "surprise", "😯": "surprise", "🤯": "surprise",
+    "😢": "sadness", "😭": "sadness", "😔": "sadness", "☹": "sadness", "🙁": "sadness", "💔": "sadness",
+    "😨": "fear", "😱": "fear", "😧": "fear",
+    "😠": "anger", "😡": "anger", "🤬": "anger",
+    "🤢": "disgust", "🤮": "disgust",
+    "😳": "guilt",
+    "😞": "shame", "🙈": "shame",
+    "😰": "anxiety", "😟": "anxiety", "😬": "anxiety",
+    "😒": "envy",
+    "😤": "frustration", "😩": "frustration", "😫": "frustration",
+    "😐": "neutral", "😶": "neutral", "👍": "neutral", "👌": "neutral",
+}
+
+
+class Route:
+    """How one input is handled: ``kind`` is "command" or "trivial"; ``name``
+    is the command or the trivial category ("empty", "emoji", "acknowledgement")"""
+
+    def __init__(self, kind, name, handler=None, emotion="neutral"):
+        self.kind = kind
+        self.name = name
+        self.handler = handler
+        self.emotion = emotion
+
+
+def emoji_emotion(text):
+    """Most frequent emotion among the known emoji in ``text``, else neutral"""
+    votes = Counter(EMOJI_EMOTIONS[ch] for ch in text if ch in EMOJI_EMOTIONS)
+    return votes.most_common(1)[0][0] if votes else "neutral"
+
+
+class CommandRouter:
+    def __init__(self, acknowledgements=()):
+        self.commands = {}
+        self.acknowledgements = frozenset(self._key(a) for a in acknowledgements)
+
+    @staticmethod
+    def _key(text):
+        return " ".join(text.lower().split()).strip(".!")
+
+    def command(self, *names):
+        """Decorator registering ``handler`` for the exact (case-insensitive) inputs ``names``"""
+        def register(handler):
+            for name in names:
+                self.commands[self._key(name)] = handler
+            return handler
+        return register
+
+    def route(self, text):
+        """Route for ``text``, or None when it needs the LLM"""
+        key = self._key(text)
+        if key in self.commands:
+            return Route("command", key, self.commands[key])
+        if not text.strip():
+            return Route("trivial", "empty")
+        if not any(unicodedata.category(ch)[0] in "LN" for ch in key):
+            return Route("trivial", "emoji", emotion=emoji_emotion(text))
+        if key in self.acknowledgements:
+            return Route("trivial", "acknowledgement")
+        return None
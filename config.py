@@ -1,2 +1,177 @@
 SECRET_NAME = "aiepax-dev-epax-frontend"
-AWS_REGION_NAME = "us-east-2"
\ No newline at end of file
+AWS_REGION_NAME = "us-east-2"
+
+# Emotion labels shared by the app, classifiers and offline tools
+EMOTIONS = [
+    "happiness", "sadness", "fear", "anger", "disgust",
+    "surprise", "love", "joy", "guilt", "shame",
+    "anxiety", "envy", "frustration", "neutral"
+]
+
+# Turn pipeline: "single_call" returns emotion + reply from one structured
+# completion, "two_call" keeps the classic detect_emotion -> request_reply path
+# and "concurrent" runs both calls in parallel, guessing the emotion up front.
+# single_call also swaps the reply model, so it stays opt-in (the sidebar
+# toggle) until its replies have been compared with two_call's
+TURN_MODES = ["single_call", "two_call", "concurrent"]
+TURN_MODE = "two_call"
+CLASSIFIER_MODEL = "gpt-3.5-turbo"
+# Structured outputs (json_schema) need a model that supports them
+SINGLE_CALL_MODEL = "gpt-4o-mini"
+
+# Concurrent mode: what to do when the fresh label differs from the guessed
+# one ("accept" or "regenerate") and how many classifier threads to share.
+# "regenerate" only starts the second reply after the guessed one finished
+# (the reply runs on the script thread), so a mismatched turn takes two full
+# reply latencies, slower than a two_call turn; the turn-pipeline stats show
+# how often that happens. Each in-flight concurrent-mode turn holds one
+# classifier thread, so size TURN_WORKERS for the expected number of
+# simultaneous sessions
+RECONCILE_POLICY = "accept"
+TURN_WORKERS = 32
+
+# Stream reply tokens into the chat as they arrive: two_call turns, and
+# concurrent turns under the "accept" policy (with "regenerate" the streamed
+# reply could still be replaced). single_call replies arrive whole, inside
+# the JSON object that also carries the emotion
+STREAM_RESPONSES = True
+
+# Normalized text -> emotion cache: in-process LRU in front of a SQLite file
+# shared by all sessions/processes. TTL in seconds, eviction "lru" or "fifo"
+EMOTION_CACHE_PATH = "emotion_cache.sqlite3"
+EMOTION_CACHE_TTL = 7 * 24 * 3600
+EMOTION_CACHE_MEMORY_ENTRIES = 1024
+EMOTION_CACHE_DISK_ENTRIES = 100_000
+EMOTION_CACHE_EVICTION = "lru"
+
+# Local first-tier classifier (train with `python local_classifier.py train`);
+# the LLM is only asked when local confidence is below LOCAL_CONFIDENCE
+LOCAL_MODEL_PATH = "emotion_model.npz"
+LOCAL_CONFIDENCE = 0.8
+
+# Token budget for the conversation history sent with each reply; the newest
+# messages that fit are kept
+HISTORY_TOKEN_BUDGET = 3000
+# Remembered details: the MEMORY_TOP_K earlier user messages most relevant to
+# the current one (BM25), within MEMORY_TOKEN_BUDGET
+MEMORY_TOP_K = 8
+MEMORY_TOKEN_BUDGET = 1000
+
+# Rolling summary: once KEEP_RECENT + BLOCK messages are unsummarised, the
+# oldest BLOCK is folded into the running summary on a background worker
+SUMMARY_KEEP_RECENT = 24
+SUMMARY_BLOCK = 12
+SUMMARY_WORKERS = 2
+
+# Shared OpenAI client connection pool (timeouts in seconds); HTTP/2 is used
+# when the h2 package is installed
+OPENAI_MAX_CONNECTIONS = 100
+OPENAI_MAX_KEEPALIVE = 20
+OPENAI_KEEPALIVE_EXPIRY = 60
+OPENAI_CONNECT_TIMEOUT = 5
+OPENAI_TIMEOUT = 30
+OPENAI_HTTP2 = True
+
+# Retries with jittered exponential backoff (seconds) and a per-process circuit
+# breaker that fails fast for BREAKER_RESET_TIMEOUT after BREAKER_FAILURES
+# consecutive provider errors
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 4.0
+BREAKER_FAILURES = 5
+BREAKER_RESET_TIMEOUT = 30
+
+# Latency budget for a whole user turn and caps for the calls inside it
+TURN_LATENCY_BUDGET = 20.0
+CLASSIFY_TIMEOUT = 5.0
+RESPONSE_TIMEOUT = 15.0
+
+# Request hedging: duplicate a classify/reply call that is slower than the
+# HEDGE_PERCENTILE latency seen so far, at most HEDGE_BUDGET extra requests
+# per request, once HEDGE_MIN_SAMPLES latencies have been observed. Hedges run
+# on HEDGE_WORKERS threads; the calls themselves are not bounded by them
+HEDGE_ENABLED = False
+HEDGE_PERCENTILE = 95
+HEDGE_BUDGET = 0.05
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WORKERS = 16
+
+# Client-side limits for the shared API key (requests and tokens per minute);
+# up to RATE_LIMIT_BURST_SECONDS worth of capacity can be used at once
+RATE_LIMIT_RPM = 3500
+RATE_LIMIT_TPM = 90000
+RATE_LIMIT_BURST_SECONDS = 10
+
+# Per-turn tracing: "jsonl" (one span per line), "otlp" (OTLP/JSON lines for an
+# OpenTelemetry collector's file receiver) or None to switch exporting off
+TRACE_EXPORTER = "jsonl"
+TRACE_PATH = "traces.jsonl"
+
+# Usage ledger: USD per million (prompt, completion) tokens for cost estimates,
+# and the port of the /metrics endpoint (None to not serve it). It has no
+# authentication, so it only listens on localhost unless METRICS_HOST is widened
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+METRICS_PORT = 9101
+METRICS_HOST = "127.0.0.1"
+
+# Offline annotation (batch_annotate.py): messages and characters packed into
+# one structured request, and how many requests run at once
+ANNOTATE_MODEL = "gpt-4o-mini"
+ANNOTATE_BATCH_SIZE = 50
+ANNOTATE_MAX_CHARS = 12_000
+ANNOTATE_CONCURRENCY = 8
+
+# How the classifier call labels a message: "logprobs" answers with a single
+# logit-biased token and returns a distribution over EMOTIONS (needs tiktoken),
+# "text" asks for the emotion name and string-matches it
+CLASSIFY_METHOD = "logprobs"
+
+# Emotional Quotient: per-emotion weights, starting score and bounds, and the
+# per-turn decay towards the start (1.0 = no decay)
+EQ_WEIGHTS = {
+    "happiness": 2, "joy": 2, "love": 3, "surprise": 1,
+    "sadness": -1, "fear": -2, "anger": -3, "disgust": -2,
+    "guilt": -1, "shame": -2, "anxiety": -2, "envy": -1,
+    "frustration": -2, "neutral": 0
+}
+EQ_START = 50
+EQ_MIN = 0
+EQ_MAX = 100
+EQ_DECAY = 1.0
+
+# Inputs the command router answers without any LLM call: one-word
+# acknowledgements, and the canned reply for each kind of trivial input
+ACKNOWLEDGEMENTS = [
+    "ok", "okay", "k", "kk", "sure", "thanks", "thank you", "thx", "ty",
+    "cool", "nice", "alright", "got it", "hmm", "hm", "mhm"
+]
+TRIVIAL_REPLIES = {
+    "acknowledgement": "I'm here whenever you want to share more. How are you feeling right now?",
+    "emoji": "I see. Would you like to tell me a bit more about what's behind that?",
+}
+
+# Session exports ("quit" / "/export"): written by background workers into
+# EXPORT_DIR, then uploaded to EXPORT_S3_BUCKET (under EXPORT_S3_PREFIX) and
+# removed locally when a bucket is set
+EXPORT_DIR = "exports"
+EXPORT_S3_BUCKET = None
+EXPORT_S3_PREFIX = "emogenie/"
+EXPORT_WORKERS = 2
+EXPORT_RETRIES = 3
+EXPORT_POLL_SECONDS = 1.0
+
+# Transcript log: every message appended to rotating JSONL segments in
+# TRANSCRIPT_DIR (None to switch it off), fsynced every TRANSCRIPT_FSYNC_SECONDS
+TRANSCRIPT_DIR = "transcripts"
+TRANSCRIPT_SEGMENT_BYTES = 64 * 2**20
+TRANSCRIPT_FSYNC_SECONDS = 1.0
+
+# Session persistence: SQLite database sessions are stored in and resumed from
+# (None to switch it off), how often buffered writes are committed, and how
+# many messages a resumed session shows before "Load older messages"
+SESSION_DB_PATH = "sessions.sqlite3"
+SESSION_COMMIT_SECONDS = 0.5
+SESSION_PAGE = 50
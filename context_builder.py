@@ -0,0 +1,84 @@
+import logging
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    """Counts tokens locally with tiktoken, or estimates them when it's missing.
+
+    tiktoken reads its BPE file from TIKTOKEN_CACHE_DIR, and downloads it
+    there on first use otherwise; the Dockerfile prefetches it into the image
+    so counting never needs the network. Without it the count is a
+    conservative words-and-punctuation estimate.
+    """
+
+    def __init__(self, model="gpt-3.5-turbo"):
+        self._encoding = None
+        if tiktoken is None:
+            logging.warning("tiktoken is not installed, estimating token counts")
+            return
+        try:
+            self._encoding = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            logging.warning(f"No {model} tokenizer ({type(e).__name__}: {e}), estimating token counts")
+
+    def count(self, text):
+        if self._encoding:
+            return len(self._encoding.encode(text))
+        return max(len(text) // 4, int(len(_PIECES.findall(text)) * 1.3))
+
+
+class ContextBuilder:
+    """Keeps the newest entries of a growing list that fit in a token budget.
+
+    Entries are rendered and counted once, when they are first seen, so each
+    build only walks back over the entries it keeps instead of re-joining the
+    whole history. ``report`` describes the last build; its "start" is the
+    index of the oldest entry in the window.
+    """
+
+    def __init__(self, budget, counter, render=str):
+        self.budget = budget
+        self.counter = counter
+        self.render = render
+        self._source = None
+        self._lines = []
+        self._tokens = []
+        self.report = {"kept": 0, "dropped": 0, "summarised": 0, "tokens": 0, "start": 0}
+
+    def sync(self, entries):
+        """Pick up entries appended since the last call; a replaced list starts over"""
+        if entries is not self._source or len(entries) < len(self._lines):
+            self._source = entries
+            self._lines = []
+            self._tokens = []
+        for entry in entries[len(self._lines):]:
+            line = self.render(entry)
+            self._lines.append(line)
+            self._tokens.append(self.counter.count(line) + 1)  # + newline
+
+    def build(self, entries, start=0):
+        """Newest entries from ``start`` on that fit the budget, one per line.
+
+        Entries before ``start`` are assumed to be covered elsewhere (e.g. by a
+        running summary) and are reported as summarised, not dropped.
+        """
+        self.sync(entries)
+        first, used = len(self._lines), 0
+        while first > start and used + self._tokens[first - 1] <= self.budget:
+            first -= 1
+            used += self._tokens[first]
+        self.report = {
+            "kept": len(self._lines) - first,
+            "dropped": first - start,
+            "summarised": start,
+            "tokens": used,
+            "start": first,
+        }
+        return "\n".join(self._lines[first:])
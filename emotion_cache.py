@@ -0,0 +1,137 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+EVICTION_POLICIES = ["lru", "fifo"]
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Collapse near-exact repeats ("I'm fine." / "i’m  FINE") onto one key"""
+    text = unicodedata.normalize("NFKC", text).replace("’", "'").lower()
+    return _SPACES.sub(" ", text).strip(" .!?,;:~")
+
+
+def namespace(model, emotions):
+    """Cache namespace; changes whenever the model or the label set does"""
+    return hashlib.sha256(f"{model}\x1f{','.join(emotions)}".encode()).hexdigest()[:16]
+
+
+class EmotionCache:
+    """Normalized text -> emotion cache with an in-process LRU tier in front of
+    a SQLite tier shared by every session and worker process on the host.
+
+    Entries older than ``ttl`` seconds are ignored and dropped. Each tier holds
+    at most its configured number of entries; the disk tier evicts by last use
+    ("lru") or by insertion time ("fifo").
+    """
+
+    def __init__(self, path, model, emotions, ttl=7 * 24 * 3600,
+                 memory_entries=1024, disk_entries=100_000, eviction="lru"):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {eviction!r}, expected one of {EVICTION_POLICIES}")
+        self.namespace = namespace(model, emotions)
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.eviction = eviction
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS emotion_cache (
+            namespace TEXT NOT NULL,
+            text TEXT NOT NULL,
+            emotion TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            used_at REAL NOT NULL,
+            PRIMARY KEY (namespace, text)
+        )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS emotion_cache_used ON emotion_cache (namespace, used_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS emotion_cache_created ON emotion_cache (namespace, created_at)")
+
+    def get(self, text):
+        """Cached emotion for ``text`` or None"""
+        key = normalize(text)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            row = self._db.execute(
+                "SELECT emotion, created_at FROM emotion_cache WHERE namespace = ? AND text = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row and now - row[1] < self.ttl:
+                if self.eviction == "lru":
+                    self._db.execute(
+                        "UPDATE emotion_cache SET used_at = ? WHERE namespace = ? AND text = ?",
+                        (now, self.namespace, key)
+                    )
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+            if row:
+                self._db.execute("DELETE FROM emotion_cache WHERE namespace = ? AND text = ?", (self.namespace, key))
+            self.misses += 1
+            return None
+
+    def put(self, text, emotion):
+        key = normalize(text)
+        now = time.time()
+        with self._lock:
+            self._remember(key, emotion, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO emotion_cache (namespace, text, emotion, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, emotion, now, now)
+            )
+            self._writes += 1
+            # Trimming the disk tier is a scan, so only do it every so often
+            if self._writes % 100 == 0:
+                self._trim_disk(now)
+
+    def _remember(self, key, emotion, created_at):
+        self._memory[key] = (emotion, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_disk(self, now):
+        self._db.execute("DELETE FROM emotion_cache WHERE created_at < ?", (now - self.ttl,))
+        order = "used_at" if self.eviction == "lru" else "created_at"
+        cursor = self._db.execute(
+            f"""DELETE FROM emotion_cache WHERE namespace = ? AND text IN (
+                SELECT text FROM emotion_cache WHERE namespace = ?
+                ORDER BY {order} DESC LIMIT -1 OFFSET ?)""",
+            (self.namespace, self.namespace, self.disk_entries)
+        )
+        self.evictions += max(cursor.rowcount, 0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
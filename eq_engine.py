@@ -0,0 +1,202 @@
+"""Vectorised Emotional Quotient scoring.
+
+The score starts at ``start``, each turn relaxes it towards ``start`` by
+``decay`` (1.0 = no decay) and adds the turn's weight, and the result is
+clamped to [low, high]:
+
+    eq[t] = clip(start + decay * (eq[t-1] - start) + weight[t], low, high)
+
+A turn's weight is EQ_WEIGHTS[emotion], or its expected value when the
+classifier produced a distribution. Re-score archived exports under other
+weights without replaying any turns:
+
+    python eq_engine.py rescore emogenie_chat*.csv --weights alt_weights.json --decay 0.9
+"""
+import argparse
+import glob
+import json
+import math
+from array import array
+
+import numpy as np
+
+from config import EMOTIONS, EQ_WEIGHTS, EQ_START, EQ_MIN, EQ_MAX, EQ_DECAY
+
+
+class EmotionTrack:
+    """One session's emotions as compact integer codes (plus their
+    distributions), appended in place and viewed as NumPy arrays"""
+
+    def __init__(self, labels=EMOTIONS):
+        self.labels = list(labels)
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        self._codes = array("B")
+        self._probs = array("f")
+        # Turns appended with a distribution; without any, the codes alone score the track
+        self.distributions = 0
+
+    def __len__(self):
+        return len(self._codes)
+
+    def append(self, emotion, probs=None):
+        code = self._index.get(emotion, self._index.get("neutral", 0))
+        self._codes.append(code)
+        row = [0.0] * len(self.labels)
+        if probs:
+            self.distributions += 1
+            for label, p in probs.items():
+                if label in self._index:
+                    row[self._index[label]] = p
+        else:
+            row[code] = 1.0
+        self._probs.extend(row)
+
+    @classmethod
+    def from_labels(cls, emotions, labels=EMOTIONS):
+        track = cls(labels)
+        for emotion in emotions:
+            track.append(emotion)
+        return track
+
+    @property
+    def codes(self):
+        return np.frombuffer(self._codes, dtype=np.uint8)
+
+    @property
+    def probs(self):
+        """(turns, labels) float32 matrix; one-hot rows for turns without a distribution"""
+        return np.frombuffer(self._probs, dtype=np.float32).reshape(-1, len(self.labels))
+
+
+class EQEngine:
+    def __init__(self, weights=EQ_WEIGHTS, labels=EMOTIONS, start=EQ_START, low=EQ_MIN, high=EQ_MAX,
+                 decay=EQ_DECAY):
+        if not 0 < decay <= 1:
+            raise ValueError(f"decay must be in (0, 1], got {decay}")
+        self.labels = list(labels)
+        self.weights = self.weight_vector(weights)
+        self.start = start
+        self.low = low
+        self.high = high
+        self.decay = decay
+
+    def weight_vector(self, table):
+        """Weight table {emotion: weight} as a vector in label order"""
+        return np.array([table.get(label, 0) for label in self.labels], dtype=np.float64)
+
+    def trajectory(self, track, weights=None):
+        """Score after every turn of one session"""
+        deltas = track.probs.astype(np.float64) @ (self.weights if weights is None else weights)
+        return self.scan(deltas[np.newaxis])[0]
+
+    def step(self, score, track):
+        """Score after ``track``'s last turn, given the ``score`` before it: one
+        clipped step of the recurrence, for updating a live session"""
+        weight = float(track.probs[-1].astype(np.float64) @ self.weights)
+        return min(max(self.start + self.decay * (score - self.start) + weight, self.low), self.high)
+
+    def score(self, track):
+        return float(self.trajectory(track)[-1]) if len(track) else float(self.start)
+
+    def rescore(self, tracks, weight_tables):
+        """Final score of every session under every weight table: (tables, sessions).
+
+        Sessions are scanned in buckets of similar length (padded to the next
+        power of two), so one long session doesn't pad all the others to its
+        length. A session without distributions takes its per-turn weights
+        straight from its codes.
+        """
+        tables = np.stack([self.weight_vector(t) for t in weight_tables])
+        final = np.full((len(tables), len(tracks)), float(self.start))
+        buckets = {}
+        for i, track in enumerate(tracks):
+            if len(track):
+                buckets.setdefault(1 << (len(track) - 1).bit_length(), []).append(i)
+        for width, members in buckets.items():
+            deltas = np.zeros((len(tables), len(members), width))
+            for j, i in enumerate(members):
+                track = tracks[i]
+                if track.distributions:
+                    deltas[:, j, :len(track)] = (track.probs @ tables.T).T
+                else:
+                    deltas[:, j, :len(track)] = tables[:, track.codes]
+            scores = self.scan(deltas.reshape(-1, width)).reshape(len(tables), len(members), width)
+            ends = np.array([len(tracks[i]) for i in members]) - 1
+            final[:, members] = scores[:, np.arange(len(members)), ends]
+        return final
+
+    def scan(self, deltas):
+        """EQ trajectories for a (sessions, turns) matrix of per-turn weights.
+
+        Each block of turns is first scored as the unclamped linear recurrence,
+        a cumulative sum rescaled by powers of ``decay``, for all sessions at
+        once. Only sessions whose block crosses a bound are re-run turn by turn
+        (still vectorised across those sessions), from their first crossing.
+        """
+        n, turns = deltas.shape
+        out = np.empty((n, turns))
+        state = np.full(n, float(self.start))
+        # Keep decay ** -block within float precision
+        block = max(turns, 1) if self.decay == 1 else max(1, int(27 / -math.log(self.decay)))
+        for b in range(0, turns, block):
+            chunk = deltas[:, b:b + block]
+            z0 = state - self.start
+            if self.decay == 1:
+                scores = self.start + z0[:, np.newaxis] + np.cumsum(chunk, axis=1)
+            else:
+                powers = self.decay ** np.arange(chunk.shape[1])
+                scores = self.start + powers * (self.decay * z0[:, np.newaxis] + np.cumsum(chunk / powers, axis=1))
+            crossed = ((scores < self.low) | (scores > self.high)).any(axis=1)
+            if crossed.any():
+                rows = np.flatnonzero(crossed)
+                first = ((scores[rows] < self.low) | (scores[rows] > self.high)).argmax(axis=1)
+                x = np.where(first > 0, scores[rows, np.maximum(first - 1, 0)], state[rows])
+                for j in range(first.min(), chunk.shape[1]):
+                    x_next = np.clip(self.start + self.decay * (x - self.start) + chunk[rows, j], self.low, self.high)
+                    active = j >= first
+                    x = np.where(active, x_next, x)
+                    scores[rows[active], j] = x[active]
+            out[:, b:b + block] = scores
+            state = scores[:, -1]
+        return out
+
+
+def load_tracks(patterns):
+    """One EmotionTrack per emogenie_chat*.csv export (its 'emotion' column)"""
+    import pandas as pd
+
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit(f"No CSV files match {patterns}")
+    tracks = []
+    for path in paths:
+        emotions = pd.read_csv(path, usecols=["emotion"])["emotion"].dropna().str.lower().str.strip()
+        tracks.append(EmotionTrack.from_labels(emotions))
+    return paths, tracks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EQ scoring tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rescore_cmd = commands.add_parser("rescore", help="final EQ of archived sessions under other weights")
+    rescore_cmd.add_argument("csv", nargs="+", help="CSV files or glob patterns")
+    rescore_cmd.add_argument("--weights", nargs="*", default=[], help="JSON files of {emotion: weight}")
+    rescore_cmd.add_argument("--decay", type=float, default=EQ_DECAY)
+    args = parser.parse_args()
+
+    paths, tracks = load_tracks(args.csv)
+    tables = {"current": EQ_WEIGHTS}
+    for path in args.weights:
+        with open(path) as f:
+            tables[path] = json.load(f)
+    engine = EQEngine(decay=args.decay)
+    final = engine.rescore(tracks, list(tables.values()))
+    print(f"{len(tracks)} sessions, {sum(len(t) for t in tracks)} turns, decay {args.decay}")
+    for name, scores in zip(tables, final):
+        p10, p50, p90 = np.percentile(scores, [10, 50, 90])
+        print(f"{name:>20}: mean {scores.mean():6.1f}  p10 {p10:6.1f}  p50 {p50:6.1f}  p90 {p90:6.1f}  "
+              f"below {engine.start}: {(scores < engine.start).mean():.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import csv
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+FIELDS = ["User_msg", "Bot_msg", "emotion"]
+
+
+def chat_rows(messages):
+    """CSV rows for every user message answered by the message after it"""
+    for i in range(0, len(messages) - 1, 2):
+        user_msg, bot_msg = messages[i], messages[i + 1]
+        if user_msg["role"] == "user" and bot_msg["role"] == "assistant":
+            yield {"User_msg": user_msg["content"], "Bot_msg": bot_msg["content"],
+                   "emotion": user_msg.get("emotion", "unknown")}
+
+
+def s3_uploader(bucket, prefix=""):
+    """upload(path) that copies a finished export to S3 and returns its URI"""
+    import boto3
+
+    s3 = boto3.client("s3")
+
+    def upload(path):
+        key = prefix + os.path.basename(path)
+        s3.upload_file(path, bucket, key)
+        return f"s3://{bucket}/{key}"
+    return upload
+
+
+class ExportJob:
+    def __init__(self, session, messages, filename):
+        self.session = session
+        self.messages = messages
+        self.filename = filename
+        self.attempts = 0
+        self.rows = 0
+        self.location = None
+        self.error = None
+
+
+class ExportQueue:
+    """Writes session transcripts to CSV on background worker threads.
+
+    ``submit`` only snapshots the message list, so the caller can reset the
+    chat straight away. Rows are streamed to a ``.part`` file that is renamed
+    into ``directory`` once complete, then optionally handed to ``upload``
+    (which returns where the file went; the local copy is removed). Failed
+    jobs are retried ``retries`` times with exponential backoff. Finished
+    jobs wait in a per-session outbox until ``finished`` collects them.
+    """
+
+    def __init__(self, directory, upload=None, workers=1, retries=3, backoff=1.0):
+        self.directory = directory
+        self.upload = upload
+        self.retries = retries
+        self.backoff = backoff
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._outbox = {}
+        os.makedirs(directory, exist_ok=True)
+        for i in range(workers):
+            threading.Thread(target=self._work, daemon=True, name=f"export-{i}").start()
+
+    def submit(self, session, messages):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        job = ExportJob(session, list(messages), f"emogenie_chat{stamp}_{session[:8]}.csv")
+        with self._lock:
+            self._pending[session] = self._pending.get(session, 0) + 1
+        self._jobs.put(job)
+        return job
+
+    def pending(self, session):
+        """Exports of ``session`` that haven't finished yet"""
+        with self._lock:
+            return self._pending.get(session, 0)
+
+    def finished(self, session):
+        """Jobs of ``session`` that finished (written or given up) since the last call"""
+        with self._lock:
+            return self._outbox.pop(session, [])
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            job.attempts += 1
+            try:
+                self._write(job)
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                if job.attempts <= self.retries:
+                    delay = self.backoff * 2 ** (job.attempts - 1)
+                    logging.warning(f"Export {job.filename} failed ({job.error}), retrying in {delay:.1f}s")
+                    threading.Timer(delay, self._jobs.put, (job,)).start()
+                    continue
+                logging.error(f"Export {job.filename} failed after {job.attempts} attempts: {job.error}")
+            self._finish(job)
+
+    def _write(self, job):
+        path = os.path.join(self.directory, job.filename)
+        started = time.perf_counter()
+        rows = 0
+        with open(path + ".part", "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, FIELDS)
+            writer.writeheader()
+            for row in chat_rows(job.messages):
+                writer.writerow(row)
+                rows += 1
+            f.flush()
+            os.fsync(f.fileno())
+        if not rows:
+            os.remove(path + ".part")
+            return
+        os.replace(path + ".part", path)
+        job.location = path
+        if self.upload:
+            job.location = self.upload(path)
+            os.remove(path)
+        job.rows, job.error = rows, None
+        logging.info(f"Exported {rows} rows to {job.location} in {time.perf_counter() - started:.2f}s")
+
+    def _finish(self, job):
+        job.messages = None
+        with self._lock:
+            self._pending[job.session] -= 1
+            if not self._pending[job.session]:
+                del self._pending[job.session]
+            if job.rows or job.error:
+                self._outbox.setdefault(job.session, []).append(job)
@@ -0,0 +1,142 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class Hedger:
+    """Request hedging for tail latency.
+
+    A call that hasn't returned after the ``hedge_percentile`` latency seen
+    for its kind gets a duplicate; whichever finishes first wins. Hedges are
+    capped at ``budget`` extra requests per primary request, so a slowdown
+    can't multiply spend. The sync client can't abort a request that is
+    already on the wire, so the losing attempt is only cancelled if it hasn't
+    started; otherwise its result is discarded (and handed to ``on_discard``,
+    so its tokens can still be accounted for).
+
+    The primary never waits for a pool thread: it runs on the calling thread
+    when no hedge is possible yet, otherwise on a thread of its own. Only
+    hedges use the ``max_workers`` pool, so the pool bounds the extra
+    requests, not the calls. Primary latencies are measured from the call,
+    with or without hedging, next to the latencies callers actually saw, so
+    ``report`` shows what hedging bought.
+    """
+
+    def __init__(self, hedge_percentile=95, budget=0.05, min_samples=20, window=500, max_workers=16):
+        self.hedge_percentile = hedge_percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._primary = {}
+        self._observed = {}
+        self.primaries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _samples(self, table, kind):
+        return table.setdefault(kind, deque(maxlen=self.window))
+
+    def _timed(self, kind, fn, args, kwargs, started=None):
+        """fn(*args, **kwargs), recorded as a primary latency since ``started`` unless it's None"""
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if started is not None:
+                with self._lock:
+                    self._samples(self._primary, kind).append(time.perf_counter() - started)
+
+    def _start(self, kind, fn, args, kwargs, started):
+        """The primary attempt on a thread of its own, in a copy of the caller's context"""
+        future = Future()
+        # Already running, so cancel() can't take it back like a queued hedge
+        future.set_running_or_notify_cancel()
+        context = contextvars.copy_context()
+
+        def run():
+            try:
+                future.set_result(context.run(self._timed, kind, fn, args, kwargs, started))
+            except BaseException as e:
+                future.set_exception(e)
+        threading.Thread(target=run, daemon=True, name="hedge-primary").start()
+        return future
+
+    def _hedge_delay(self, kind):
+        with self._lock:
+            samples = list(self._samples(self._primary, kind))
+            if len(samples) < self.min_samples or self.hedges + 1 > self.budget * self.primaries:
+                return None
+        return percentile(samples, self.hedge_percentile)
+
+    def call(self, kind, fn, *args, on_discard=None, **kwargs):
+        """fn(*args, **kwargs), hedged once if it's slow and the budget allows.
+        ``on_discard(result)`` is called with the losing attempt's result, if it succeeds"""
+        started = time.perf_counter()
+        with self._lock:
+            self.primaries += 1
+        delay = self._hedge_delay(kind)
+        try:
+            if delay is None:
+                return self._timed(kind, fn, args, kwargs, started)
+            primary = self._start(kind, fn, args, kwargs, started)
+            if wait([primary], timeout=max(0.0, delay - (time.perf_counter() - started))).done:
+                return primary.result()
+            with self._lock:
+                if self.hedges + 1 > self.budget * self.primaries:
+                    hedge = None
+                else:
+                    self.hedges += 1
+                    hedge = self._pool.submit(contextvars.copy_context().run, self._timed, kind, fn, args, kwargs)
+            if hedge is None:
+                return primary.result()
+
+            done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+            first = primary if primary in done else hedge
+            other = hedge if first is primary else primary
+            winner = first
+            if first.exception() is not None:
+                # The first to finish failed, give the other one its chance
+                wait([other])
+                winner = other if other.exception() is None else primary
+            loser = hedge if winner is primary else primary
+            loser.cancel()
+            if on_discard:
+                loser.add_done_callback(
+                    lambda f: on_discard(f.result()) if not f.cancelled() and f.exception() is None else None
+                )
+            if winner is hedge:
+                with self._lock:
+                    self.hedge_wins += 1
+            return winner.result()
+        finally:
+            with self._lock:
+                self._samples(self._observed, kind).append(time.perf_counter() - started)
+
+    def report(self):
+        """Per-kind primary vs observed p50/p95/p99 (seconds) and the extra spend"""
+        with self._lock:
+            kinds = {
+                kind: {
+                    f"{name}_p{p}": percentile(list(table.get(kind, ())), p)
+                    for name, table in (("primary", self._primary), ("observed", self._observed))
+                    for p in (50, 95, 99)
+                }
+                for kind in self._observed
+            }
+            return {
+                "primaries": self.primaries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "extra_requests": self.hedges / self.primaries if self.primaries else 0.0,
+                "kinds": kinds,
+            }
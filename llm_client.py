@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import threading
+
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+
+from config import (OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE, OPENAI_KEEPALIVE_EXPIRY,
+                    OPENAI_CONNECT_TIMEOUT, OPENAI_TIMEOUT, OPENAI_HTTP2, RETRY_MAX_ATTEMPTS,
+                    RETRY_BASE_DELAY, RETRY_MAX_DELAY, BREAKER_FAILURES, BREAKER_RESET_TIMEOUT,
+                    HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_MIN_SAMPLES, HEDGE_WORKERS, RATE_LIMIT_RPM, RATE_LIMIT_TPM,
+                    RATE_LIMIT_BURST_SECONDS)
+from resilience import CircuitBreaker, ResilientCompletions
+from hedging import Hedger
+from rate_limiter import FairRateLimiter
+
+_client = None
+_completions = None
+_hedger = None
+_lock = threading.Lock()
+
+
+def build_client(**overrides):
+    """New OpenAI client with its own tuned connection pool.
+
+    The API key and base URL come from the environment (OPENAI_API_KEY,
+    OPENAI_BASE_URL) unless passed in ``overrides``.
+    """
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        # HTTP/2 needs the optional h2 package
+        http2=OPENAI_HTTP2 and importlib.util.find_spec("h2") is not None
+    )
+    options = {"api_key": os.getenv("OPENAI_API_KEY"), "http_client": http_client}
+    options.update(overrides)
+    return OpenAI(**options)
+
+
+def get_client():
+    """The process-wide OpenAI client.
+
+    Built once, on first use, and shared by every Streamlit session and
+    script thread so TLS connections are kept alive and reused. The client
+    and its httpx pool are safe to use from several threads.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = build_client()
+    return _client
+
+
+def get_completions():
+    """Process-wide chat completions with retries, a circuit breaker and a
+    rate limiter shared fairly by all sessions"""
+    global _completions
+    if _completions is None:
+        client = get_client()
+        with _lock:
+            if _completions is None:
+                _completions = ResilientCompletions(
+                    client,
+                    CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_TIMEOUT),
+                    max_attempts=RETRY_MAX_ATTEMPTS,
+                    base_delay=RETRY_BASE_DELAY,
+                    max_delay=RETRY_MAX_DELAY,
+                    limiter=FairRateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM, RATE_LIMIT_BURST_SECONDS)
+                )
+    return _completions
+
+
+def get_hedger():
+    """Process-wide hedger, so the latency percentiles and budget are shared"""
+    global _hedger
+    with _lock:
+        if _hedger is None:
+            _hedger = Hedger(HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_MIN_SAMPLES, max_workers=HEDGE_WORKERS)
+    return _hedger
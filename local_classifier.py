@@ -0,0 +1,203 @@
+"""Local, CPU-only emotion classifier used in front of the LLM.
+
+A multinomial logistic regression over hashed word uni/bigrams and character
+trigrams, scored with NumPy in microseconds. Train and evaluate it offline on
+exported chats:
+
+    python local_classifier.py train emogenie_chat*.csv --out emotion_model.npz
+    python local_classifier.py eval emotion_model.npz emogenie_chat*.csv
+"""
+import argparse
+import glob
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+from config import EMOTIONS
+
+DIM = 2 ** 18
+
+_TOKENS = re.compile(r"\w+|[^\w\s]")
+
+
+def features(text, dim=DIM):
+    """Hashed feature indices and L2-normalised values for one message"""
+    text = unicodedata.normalize("NFKC", text).replace("’", "'").lower()
+    tokens = _TOKENS.findall(text)
+    grams = [f"w:{t}" for t in tokens]
+    grams += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for t in tokens:
+        if len(t) > 3:
+            padded = f"#{t}#"
+            grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    if not grams:
+        grams = ["<empty>"]
+    idx, counts = np.unique(
+        np.fromiter((zlib.crc32(g.encode()) % dim for g in grams), dtype=np.int64, count=len(grams)),
+        return_counts=True
+    )
+    values = counts.astype(np.float32)
+    return idx, values / np.linalg.norm(values)
+
+
+class LocalEmotionClassifier:
+    """Linear model over hashed n-grams. ``predict`` returns (label, confidence)
+    and ``classify`` only answers when the confidence clears ``threshold``."""
+
+    def __init__(self, weights, bias, labels, threshold=0.8):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.confident = 0
+        self.deferred = 0
+
+    @classmethod
+    def load(cls, path, threshold=0.8):
+        model = np.load(path)
+        labels = [str(label) for label in model["labels"]]
+        if labels != EMOTIONS:
+            raise ValueError(f"{path} was trained on labels {labels}, expected {EMOTIONS}")
+        return cls(model["weights"], model["bias"], labels, threshold)
+
+    def save(self, path):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+
+    def probabilities(self, text):
+        idx, values = features(text, self.weights.shape[0])
+        logits = values @ self.weights[idx] + self.bias
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum()
+
+    def predict(self, text):
+        probs = self.probabilities(text)
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def classify(self, text):
+        """Confident label for ``text`` or None when the LLM should decide"""
+        label, confidence = self.predict(text)
+        confident = confidence >= self.threshold
+        with self._lock:
+            self.confident += confident
+            self.deferred += not confident
+        return label if confident else None
+
+    def stats(self):
+        with self._lock:
+            total = self.confident + self.deferred
+            return {
+                "confident": self.confident,
+                "deferred": self.deferred,
+                "local_rate": self.confident / total if total else 0.0,
+            }
+
+
+def _design(texts, dim):
+    """Flattened sparse design matrix: (row ids, feature ids, values)"""
+    rows, cols, vals = [], [], []
+    for row, text in enumerate(texts):
+        idx, values = features(text, dim)
+        rows.append(np.full(len(idx), row))
+        cols.append(idx)
+        vals.append(values)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+
+def _logits(design, n, weights, bias):
+    rows, cols, vals = design
+    logits = np.empty((n, weights.shape[1]), dtype=np.float32)
+    for k in range(weights.shape[1]):
+        logits[:, k] = np.bincount(rows, weights=vals * weights[cols, k], minlength=n)
+    return logits + bias
+
+
+def train(texts, labels, dim=DIM, epochs=150, lr=0.5, l2=1e-5):
+    """Fit softmax regression with full-batch AdaGrad"""
+    n, k = len(texts), len(EMOTIONS)
+    design = _design(texts, dim)
+    rows, cols, vals = design
+    y = np.array([EMOTIONS.index(label) for label in labels])
+    onehot = np.eye(k, dtype=np.float32)[y]
+
+    weights = np.zeros((dim, k), dtype=np.float32)
+    bias = np.zeros(k, dtype=np.float32)
+    grad_sq_w = np.full((dim, k), 1e-8, dtype=np.float32)
+    grad_sq_b = np.full(k, 1e-8, dtype=np.float32)
+    for _ in range(epochs):
+        logits = _logits(design, n, weights, bias)
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        error = (probs - onehot) / n
+        grad_w = np.empty_like(weights)
+        for j in range(k):
+            grad_w[:, j] = np.bincount(cols, weights=vals * error[rows, j], minlength=dim)
+        grad_w += l2 * weights
+        grad_b = error.sum(axis=0)
+        grad_sq_w += grad_w ** 2
+        grad_sq_b += grad_b ** 2
+        weights -= lr * grad_w / np.sqrt(grad_sq_w)
+        bias -= lr * grad_b / np.sqrt(grad_sq_b)
+    return LocalEmotionClassifier(weights, bias, EMOTIONS)
+
+
+def load_chats(patterns):
+    """(User_msg, emotion) pairs from emogenie_chat*.csv exports, unknown labels dropped"""
+    import pandas as pd
+
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit(f"No CSV files match {patterns}")
+    df = pd.concat([pd.read_csv(p, usecols=["User_msg", "emotion"]) for p in paths], ignore_index=True)
+    df = df.dropna()
+    df["emotion"] = df["emotion"].str.lower().str.strip()
+    df = df[df["emotion"].isin(EMOTIONS)]
+    return df["User_msg"].astype(str).tolist(), df["emotion"].tolist()
+
+
+def evaluate(model, texts, labels, thresholds=(0.5, 0.6, 0.7, 0.8, 0.9)):
+    predictions = [model.predict(text) for text in texts]
+    correct = np.array([p[0] == label for p, label in zip(predictions, labels)])
+    confidence = np.array([p[1] for p in predictions])
+    print(f"messages: {len(texts)}  accuracy: {correct.mean():.3f}")
+    for threshold in thresholds:
+        covered = confidence >= threshold
+        accuracy = correct[covered].mean() if covered.any() else float("nan")
+        print(f"threshold {threshold:.2f}: answered locally {covered.mean():.1%}, accuracy there {accuracy:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local emotion classifier")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_cmd = commands.add_parser("train", help="fit a model from emogenie_chat*.csv exports")
+    train_cmd.add_argument("csv", nargs="+", help="CSV files or glob patterns")
+    train_cmd.add_argument("--out", default="emotion_model.npz")
+    train_cmd.add_argument("--epochs", type=int, default=150)
+    train_cmd.add_argument("--holdout", type=float, default=0.2, help="fraction kept back for evaluation")
+    train_cmd.add_argument("--seed", type=int, default=0)
+    eval_cmd = commands.add_parser("eval", help="score a saved model against labelled exports")
+    eval_cmd.add_argument("model")
+    eval_cmd.add_argument("csv", nargs="+")
+    args = parser.parse_args()
+
+    texts, labels = load_chats(args.csv)
+    if args.command == "eval":
+        evaluate(LocalEmotionClassifier.load(args.model), texts, labels)
+        return
+
+    order = np.random.default_rng(args.seed).permutation(len(texts))
+    split = int(len(texts) * (1 - args.holdout))
+    fit, held = order[:split], order[split:]
+    model = train([texts[i] for i in fit], [labels[i] for i in fit], epochs=args.epochs)
+    model.save(args.out)
+    print(f"Saved {args.out} ({len(fit)} training messages)")
+    if len(held):
+        evaluate(model, [texts[i] for i in held], [labels[i] for i in held])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+class LogprobClassifier:
+    """Single-token emotion classification that returns a full distribution.
+
+    Every label is answered with one token: the label's first token when
+    those are all distinct, otherwise a letter code (A, B, ...). The request
+    biases the sampler towards exactly those tokens, asks for one token and
+    its top logprobs, and ``distribution`` turns the logprobs into
+    probabilities over all labels. When a response carries no logprobs the
+    text answer is used as a one-hot distribution.
+    """
+
+    def __init__(self, labels, encoding):
+        self.labels = list(labels)
+        first_tokens = [encoding.encode(label)[0] for label in self.labels]
+        if len(set(first_tokens)) == len(self.labels):
+            self.codes = self.labels
+            self.token_ids = first_tokens
+        else:
+            self.codes = [chr(ord("A") + i) for i in range(len(self.labels))]
+            self.token_ids = [encoding.encode(code)[0] for code in self.codes]
+        self._label_of = {encoding.decode([t]): label for t, label in zip(self.token_ids, self.labels)}
+        self._label_of.update({code.lower(): label for code, label in zip(self.codes, self.labels)})
+
+    @classmethod
+    def for_model(cls, model, labels):
+        """Classifier using ``model``'s tokenizer, or None when tiktoken can't provide it
+        (the BPE file comes from TIKTOKEN_CACHE_DIR, prefetched by the Dockerfile)"""
+        if tiktoken is None:
+            logging.warning("tiktoken is not installed, classifying with text labels")
+            return None
+        try:
+            return cls(labels, tiktoken.encoding_for_model(model))
+        except Exception as e:
+            logging.warning(f"No {model} tokenizer ({type(e).__name__}: {e}), classifying with text labels")
+            return None
+
+    def instructions(self):
+        if self.codes is self.labels:
+            return "Return ONLY the emotion name."
+        options = ", ".join(f"{code} = {label}" for code, label in zip(self.codes, self.labels))
+        return f"Return ONLY the letter of the emotion: {options}."
+
+    def request_kwargs(self):
+        return {
+            "max_tokens": 1,
+            "logit_bias": {str(token): 100 for token in self.token_ids},
+            "logprobs": True,
+            "top_logprobs": min(20, len(self.labels)),
+        }
+
+    def distribution(self, response):
+        """{label: probability} over every label, summing to 1"""
+        choice = response.choices[0]
+        content = choice.logprobs.content if getattr(choice, "logprobs", None) else None
+        probs = dict.fromkeys(self.labels, 0.0)
+        if content:
+            for candidate in content[0].top_logprobs:
+                label = self._label_of.get(candidate.token)
+                if label:
+                    probs[label] += math.exp(candidate.logprob)
+        total = sum(probs.values())
+        if total == 0:
+            answer = (choice.message.content or "").strip().lower()
+            label = self._label_of.get(answer) or next((l for l in self.labels if answer.startswith(l)), "neutral")
+            probs[label] = total = 1.0
+        return {label: p / total for label, p in probs.items()}
+
+
+class RecentDistributions:
+    """Bounded normalized-text -> distribution map, so the turn that asked for a
+    classification can store the distribution with its message"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, probs):
+        with self._lock:
+            self._entries[key] = probs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
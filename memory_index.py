@@ -0,0 +1,89 @@
+import math
+import re
+from array import array
+
+import numpy as np
+
+_WORDS = re.compile(r"[a-z0-9']+")
+
+STOPWORDS = frozenset("""
+a about am an and are as at be been but by can could did do does for from had has have he her
+him his how i i'm if in into is it it's its just me my myself no not of on or our she so some
+than that the their them then there they this to too very was we were what when where which
+who why will with would you your
+""".split())
+
+
+def terms(text):
+    return [t for t in _WORDS.findall(text.lower()) if t not in STOPWORDS]
+
+
+class MemoryIndex:
+    """Incremental BM25 index over one session's remembered messages.
+
+    Postings are kept in typed arrays that grow in place on ``add`` and are
+    viewed as NumPy arrays at query time, so scoring only touches documents
+    that share a term with the query. Each memory carries a caller-supplied
+    ``key`` (its position in the transcript) so a search can skip memories
+    that are already in the prompt.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.texts = []
+        self._seen = set()
+        self._keys = array("q")
+        self._lengths = array("f")
+        self._total_length = 0
+        self._postings = {}  # term -> (doc ids, term frequencies)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, key, text):
+        """Index one memory; exact repeats of an earlier memory are skipped"""
+        normalized = " ".join(text.lower().split())
+        if normalized in self._seen:
+            return
+        self._seen.add(normalized)
+        doc = len(self.texts)
+        tokens = terms(text)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            docs, freqs = self._postings.setdefault(token, (array("q"), array("f")))
+            docs.append(doc)
+            freqs.append(count)
+        self.texts.append(text)
+        self._keys.append(key)
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+
+    def search(self, query, k=8, before=None):
+        """Up to ``k`` (key, text) pairs ranked by BM25 relevance to ``query``.
+
+        Only memories with key < ``before`` are considered when it is given.
+        """
+        n = len(self.texts)
+        if not n:
+            return []
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(self._total_length / n, 1e-9))
+        scores = np.zeros(n, dtype=np.float32)
+        for token in set(terms(query)):
+            if token not in self._postings:
+                continue
+            docs, freqs = self._postings[token]
+            docs = np.frombuffer(docs, dtype=np.int64)
+            freqs = np.frombuffer(freqs, dtype=np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norm[docs])
+        if before is not None:
+            scores[np.frombuffer(self._keys, dtype=np.int64) >= before] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self._keys[i], self.texts[i]) for i in ranked]
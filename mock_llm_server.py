@@ -0,0 +1,277 @@
+"""Local OpenAI-compatible chat completions server for load and latency tests.
+
+    python mock_llm_server.py --port 8000 --latency-median 0.6 --tokens-per-second 60 --rate-limit-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock streamlit run app12.py
+
+Speaks POST /v1/chat/completions (plain, stream=True and json_schema
+response formats) and GET /v1/models. Latency is lognormal time-to-first-token
+plus completion tokens at a fixed throughput. Errors and 429s can be injected
+at a given rate. Emotion labels are deterministic for a given text, so runs are
+reproducible. Classify requests asking for ``logprobs`` get one answer token
+and its ``top_logprobs``: the letter codes when the prompt lists them, else the
+labels themselves.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import EMOTIONS
+
+KEYWORDS = {
+    "happy": "happiness", "great": "happiness", "good": "happiness", "glad": "happiness",
+    "sad": "sadness", "down": "sadness", "lonely": "sadness", "cry": "sadness",
+    "scared": "fear", "afraid": "fear", "terrified": "fear",
+    "angry": "anger", "furious": "anger", "mad": "anger",
+    "gross": "disgust", "disgusting": "disgust",
+    "wow": "surprise", "unexpected": "surprise",
+    "love": "love", "adore": "love",
+    "excited": "joy", "amazing": "joy",
+    "guilty": "guilt", "sorry": "guilt",
+    "ashamed": "shame", "embarrassed": "shame",
+    "anxious": "anxiety", "worried": "anxiety", "nervous": "anxiety", "stressed": "anxiety",
+    "jealous": "envy", "envy": "envy",
+    "frustrated": "frustration", "annoyed": "frustration", "stuck": "frustration",
+    "ok": "neutral", "fine": "neutral", "thanks": "neutral", "hi": "neutral", "quit": "neutral",
+}
+
+REPLY = ("It sounds like a lot is on your mind right now, and it makes sense that you feel this way. "
+         "Thank you for trusting me with it. What part of this feels heaviest for you today, "
+         "and what has helped you get through moments like this before?")
+
+_WORDS = re.compile(r"[a-z']+")
+# "A = happiness, B = sadness, ..." in a letter-coded classify prompt
+_CODES = re.compile(r"\b([A-Z]) = ([a-z]+)")
+
+
+def label_for(text):
+    """Deterministic emotion: keyword match, else a stable hash of the text"""
+    for word in _WORDS.findall(text.lower()):
+        if word in KEYWORDS:
+            return KEYWORDS[word]
+    return EMOTIONS[zlib.crc32(text.encode()) % len(EMOTIONS)]
+
+
+def classify_answer(request, user):
+    """(token, probability) of every answer to a classify request, most likely
+    first: 0.7 on the text's label, 0.2 on a runner-up and the rest spread evenly"""
+    messages = request.get("messages", [])
+    codes = {label: code for code, label in _CODES.findall(messages[0].get("content", "") if messages else "")}
+    label = label_for(user)
+    others = [e for e in EMOTIONS if e != label]
+    runner_up = others[zlib.crc32(user.encode()) % len(others)]
+    rest = 0.1 / (len(others) - 1)
+    answers = [(label, 0.7), (runner_up, 0.2)] + [(e, rest) for e in others if e != runner_up]
+    return [(codes.get(e, e), p) for e, p in answers]
+
+
+def logprobs_for(request, user):
+    """The ``logprobs`` of a classify choice: its one token and the top alternatives"""
+    answers = classify_answer(request, user)
+    top = [{"token": token, "logprob": math.log(p), "bytes": list(token.encode())}
+           for token, p in answers[:request.get("top_logprobs") or 0]]
+    token, p = answers[0]
+    return {"content": [{"token": token, "logprob": math.log(p), "bytes": list(token.encode()),
+                         "top_logprobs": top}]}
+
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class MockSettings:
+    def __init__(self, latency_median=0.5, latency_sigma=0.4, tokens_per_second=50.0,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, seed=0, observer=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        # observer(kind, seconds, status) is called once per finished request
+        self.observer = observer
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(time to first token, injected fault or None) for one request"""
+        with self._lock:
+            ttft = self.latency_median * math.exp(self._random.gauss(0, self.latency_sigma))
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return ttft, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return ttft, 500
+        return ttft, None
+
+
+def request_kind(request):
+    """Which call a request is: classify, single_call, annotate, summary or respond"""
+    response_format = request.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        if response_format.get("json_schema", {}).get("name") == "emotion_annotations":
+            return "annotate"
+        return "single_call"
+    messages = request.get("messages", [])
+    system = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+    if system.startswith("Classify"):
+        return "classify"
+    if system.startswith("Update the running summary"):
+        return "summary"
+    return "respond"
+
+
+def user_text(request):
+    """The request's last user message"""
+    return next((m.get("content", "") for m in reversed(request.get("messages", [])) if m.get("role") == "user"), "")
+
+
+def completion_text(request):
+    """What the mock model answers for a chat completions request"""
+    user = user_text(request)
+    words = REPLY.split()[:max(1, request.get("max_tokens") or 250)]
+    reply = " ".join(words)
+    kind = request_kind(request)
+    if kind == "single_call":
+        return json.dumps({"emotion": label_for(user), "reply": reply})
+    if kind == "classify":
+        return classify_answer(request, user)[0][0]
+    if kind == "annotate":
+        return json.dumps({"labels": [{"id": m["id"], "emotion": label_for(m["text"])} for m in json.loads(user)]})
+    return reply
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "gpt-3.5-turbo", "object": "model", "owned_by": "mock"},
+                {"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"},
+            ]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        started = time.perf_counter()
+        status = self._complete(request)
+        if self.settings.observer:
+            self.settings.observer(request_kind(request), time.perf_counter() - started, status)
+
+    def _complete(self, request):
+        ttft, fault = self.settings.draw()
+        if fault == 429:
+            self._send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+                            headers=[("Retry-After", str(self.settings.retry_after))])
+            return 429
+        time.sleep(ttft)
+        if fault == 500:
+            self._send_json(500, {"error": {"message": "Injected server error (mock)", "type": "server_error"}})
+            return 500
+
+        text = completion_text(request)
+        prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in request.get("messages", []))
+        completion_tokens = count_tokens(text)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        base = {"id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                "model": request.get("model", "gpt-3.5-turbo")}
+        if request.get("stream"):
+            self._stream(base, text, usage, request)
+            return 200
+
+        time.sleep(completion_tokens / self.settings.tokens_per_second)
+        choice = {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+        if request.get("logprobs") and request_kind(request) == "classify":
+            choice["logprobs"] = logprobs_for(request, user_text(request))
+        self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [choice]})
+        return 200
+
+    def _stream(self, base, text, usage, request):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(data):
+            payload = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            ]})
+
+        event(chunk({"role": "assistant", "content": ""}))
+        for piece in re.findall(r"\S+\s*", text):
+            event(chunk({"content": piece}))
+            time.sleep(max(1, count_tokens(piece)) / self.settings.tokens_per_second)
+        event(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(host="127.0.0.1", port=8000, settings=None):
+    """Start the mock server on a background thread and return it"""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"settings": settings or MockSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-median", type=float, default=0.5, help="median time to first token (s)")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="lognormal spread of that latency")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_median, args.latency_sigma, args.tokens_per_second,
+                            args.error_rate, args.rate_limit_rate, args.retry_after, args.seed)
+    server = serve(args.host, args.port, settings)
+    print(f"Mock OpenAI server on http://{args.host}:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+from hedging import percentile
+
+# Session the current thread's LLM calls are charged to; set by the app at the
+# start of each script run and carried into worker threads with the context
+current_session = contextvars.ContextVar("current_session", default=None)
+
+
+class RateLimitTimeout(Exception):
+    """No capacity was granted before the caller's deadline"""
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst_seconds):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        """Seconds until ``amount`` is available (amounts above capacity wait for a full bucket)"""
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+class FairRateLimiter:
+    """Process-wide requests-per-minute and tokens-per-minute limiter with
+    weighted fair queueing across sessions.
+
+    Every caller gets a start-time fair queueing tag from its session's last
+    finish tag, so a session that fires many calls queues behind its own
+    earlier calls while other sessions' calls interleave with them. Callers
+    block on a shared condition, which works across Streamlit's
+    thread-per-session model.
+    """
+
+    def __init__(self, rpm, tpm, burst_seconds=10):
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._finish = {}
+        self._waits = deque(maxlen=1000)
+        self.granted = 0
+        self.timeouts = 0
+
+    def acquire(self, session, tokens, weight=1.0, timeout=None):
+        """Block until one request and ``tokens`` tokens are granted; returns the wait in seconds"""
+        started = time.monotonic()
+        with self._cond:
+            start_tag = max(self._virtual_time, self._finish.get(session, 0.0))
+            self._finish[session] = start_tag + tokens / weight
+            entry = (start_tag, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            while True:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                pause = None
+                if self._queue[0] == entry:
+                    pause = max(self.requests.wait_for(1), self.tokens.wait_for(tokens))
+                    if pause == 0:
+                        heapq.heappop(self._queue)
+                        self.requests.level -= 1
+                        self.tokens.level -= min(tokens, self.tokens.capacity)
+                        self._virtual_time = start_tag
+                        waited = now - started
+                        self._waits.append(waited)
+                        self.granted += 1
+                        self._forget_idle_sessions()
+                        self._cond.notify_all()
+                        return waited
+                if timeout is not None:
+                    remaining = started + timeout - now
+                    if remaining <= 0:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        self.timeouts += 1
+                        self._cond.notify_all()
+                        raise RateLimitTimeout(f"Waited {now - started:.2f}s for rate limit capacity")
+                    pause = remaining if pause is None else min(pause, remaining)
+                self._cond.wait(pause)
+
+    def _forget_idle_sessions(self):
+        if len(self._finish) > 1000:
+            self._finish = {s: f for s, f in self._finish.items() if f > self._virtual_time}
+
+    def stats(self):
+        with self._cond:
+            waits = list(self._waits)
+            return {
+                "granted": self.granted,
+                "queued": len(self._queue),
+                "timeouts": self.timeouts,
+                "wait_p50": percentile(waits, 50) or 0.0,
+                "wait_p95": percentile(waits, 95) or 0.0,
+                "wait_max": max(waits, default=0.0),
+            }
@@ -0,0 +1,188 @@
+import logging
+import random
+import threading
+import time
+
+import openai
+
+from rate_limiter import RateLimitTimeout, current_session
+from tracing import current_span, get_tracer
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """The call's latency budget ran out before a response arrived"""
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def estimate_tokens(kwargs):
+    """Rough prompt + completion tokens of a request, as rate limits count them"""
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", ()))
+    return prompt_chars // 4 + kwargs.get("max_tokens", 256)
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, if it said so"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class CircuitBreaker:
+    """Per-process breaker: after ``failure_threshold`` consecutive provider
+    failures it opens and calls fail fast for ``reset_timeout`` seconds, then
+    a single trial call decides whether it closes again."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_running = False
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return self.state == "closed"
+
+    def is_open(self):
+        """Whether calls fail fast right now; unlike ``allow`` this never takes the
+        half-open trial slot"""
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                    logging.warning(f"Circuit breaker opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+
+class ResilientCompletions:
+    """chat.completions.create with jittered exponential backoff, Retry-After,
+    a circuit breaker and an absolute per-call deadline.
+
+    The SDK's own retries are switched off so this is the only retry loop.
+    With a ``limiter`` every attempt first waits for rate limit capacity,
+    charged to the calling session. Errors that survive the retries,
+    CircuitOpenError and DeadlineExceeded are raised for the caller's
+    existing fallback to handle.
+    """
+
+    def __init__(self, client, breaker, max_attempts=4, base_delay=0.25, max_delay=4.0, limiter=None):
+        self.client = client.with_options(max_retries=0)
+        self.breaker = breaker
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.short_circuited = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def create(self, deadline=None, **kwargs):
+        """``deadline`` is a time.monotonic() timestamp; None means the client timeout"""
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            # Don't spend rate limit capacity (or queue) for a call that will fail fast
+            if self.breaker.is_open():
+                self._count("short_circuited")
+                raise CircuitOpenError("OpenAI circuit breaker is open")
+            if self.limiter:
+                try:
+                    with get_tracer().span("llm.queue_wait", attempt=attempt + 1):
+                        self.limiter.acquire(
+                            current_session.get(), estimate_tokens(kwargs),
+                            timeout=None if deadline is None else deadline - time.monotonic()
+                        )
+                except RateLimitTimeout as e:
+                    self._count("failures")
+                    raise DeadlineExceeded(str(e)) from e
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self._count("failures")
+                raise DeadlineExceeded("No latency budget left for the call")
+            # Checked last: a half-open breaker's trial call must actually be made
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                raise CircuitOpenError("OpenAI circuit breaker is open")
+            try:
+                response = self.client.chat.completions.create(
+                    **kwargs, **({} if remaining is None else {"timeout": remaining})
+                )
+            except Exception as e:
+                if not is_retryable(e):
+                    # Our request was bad, the provider itself is fine
+                    self.breaker.record_success()
+                    self._count("failures")
+                    raise
+                self.breaker.record_failure()
+                delay = retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+                if attempt == self.max_attempts - 1 or out_of_time:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                logging.info(f"Retrying chat completion in {delay:.2f}s after {type(e).__name__}")
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                if current_span():
+                    current_span().set(attempts=attempt + 1)
+                return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                "breaker": self.breaker.state,
+                "breaker_trips": self.breaker.trips,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "short_circuited": self.short_circuited,
+            }
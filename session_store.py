@@ -0,0 +1,208 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class SessionStore:
+    """Chat sessions persisted to SQLite, so a session can be resumed by id.
+
+    Appends and session updates are buffered in memory and committed in one
+    transaction by a background thread every ``commit_interval`` seconds (and
+    before any read), so a turn never waits on a commit. The database runs in
+    WAL mode, so readers in other processes are not blocked by the writer.
+
+    Each message gets the next position in its session (``seq``) when it is
+    committed, so two tabs or processes appending to the same session both
+    keep their messages. A reset starts the chat over from the next position
+    instead of deleting anything, and loads only return messages after the
+    last reset. The session row also keeps the chat's rolling summary and how
+    many leading messages it covers (``summary_upto``).
+
+    The primary key serves the newest page of a session and the page before a
+    given seq; an index on (session, role, seq) serves every user message of
+    a session, in order, for the memory index, the EQ and the charts.
+    """
+
+    def __init__(self, path, commit_interval=0.5):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commits = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._messages = []
+        self._sessions = {}
+        self._closed = threading.Event()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            start_seq INTEGER NOT NULL DEFAULT 0,
+            eq_score INTEGER,
+            turn_mode TEXT,
+            summary TEXT,
+            summary_upto INTEGER NOT NULL DEFAULT 0
+        )""")
+        # Databases created before the summary was stored
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:
+            self._db.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+            self._db.execute("ALTER TABLE sessions ADD COLUMN summary_upto INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS messages (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            emotion TEXT,
+            emotion_probs TEXT,
+            time TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (session_id, seq)
+        ) WITHOUT ROWID""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_emotions "
+                         "ON messages (session_id, role, seq, emotion, emotion_probs)")
+        self._thread = threading.Thread(target=self._run, daemon=True, name="session-store")
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, session, message):
+        """Queue ``message`` as the next message of ``session``"""
+        probs = message.get("emotion_probs")
+        row = (session, message["role"], message["content"], message.get("emotion"),
+               json.dumps(probs) if probs else None, message.get("time"), time.time())
+        with self._lock:
+            self._messages.append(row)
+            self._touch(session)
+
+    def save(self, session, **fields):
+        """Queue an update of ``session``'s eq_score / turn_mode / summary / summary_upto"""
+        with self._lock:
+            self._touch(session).update(fields)
+
+    def reset(self, session):
+        """Queue a reset of ``session``: it starts over after the messages appended so far"""
+        with self._lock:
+            self._touch(session)["reset_after"] = sum(row[0] == session for row in self._messages)
+
+    def _touch(self, session):
+        return self._sessions.setdefault(session, {})
+
+    def flush(self):
+        """Commit everything queued so far in one transaction"""
+        with self._db_lock:
+            with self._lock:
+                messages, sessions = self._messages, self._sessions
+                self._messages, self._sessions = [], {}
+            if not messages and not sessions:
+                return
+            now = time.time()
+            # IMMEDIATE takes the write lock up front, so no other process can
+            # take the same next seq between reading and using it
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at",
+                    [(session, now, now) for session in sessions]
+                )
+                for column in ("eq_score", "turn_mode", "summary", "summary_upto"):
+                    self._db.executemany(
+                        f"UPDATE sessions SET {column} = ? WHERE id = ?",
+                        [(f[column], s) for s, f in sessions.items() if column in f]
+                    )
+                next_seq = {
+                    session: self._db.execute(
+                        "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session,)
+                    ).fetchone()[0]
+                    for session in sessions
+                }
+                self._db.executemany(
+                    "UPDATE sessions SET start_seq = ? WHERE id = ?",
+                    [(next_seq[s] + f["reset_after"], s) for s, f in sessions.items() if "reset_after" in f]
+                )
+                rows = []
+                for session, *fields in messages:
+                    rows.append((session, next_seq[session], *fields))
+                    next_seq[session] += 1
+                self._db.executemany(
+                    "INSERT INTO messages (session_id, seq, role, content, emotion, emotion_probs, "
+                    "time, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                # Put the batch back in front of anything queued meanwhile, for the next attempt
+                with self._lock:
+                    self._messages[:0] = messages
+                    for session, fields in sessions.items():
+                        queued = self._sessions.get(session, {})
+                        if "reset_after" in queued:
+                            # That reset came after this batch's messages too
+                            queued["reset_after"] += sum(row[0] == session for row in messages)
+                        self._sessions[session] = {**fields, **queued}
+                raise
+            self.commits += 1
+
+    def _run(self):
+        while not self._closed.wait(self.commit_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Session store commit failed, retrying: {e}")
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+
+    def load(self, session, page=50):
+        """Resume ``session``: None if it is unknown, else its eq_score, turn_mode,
+        summary and summary_upto, the seq of its first message (``start``) and
+        of the first one returned (``offset``), every user message since the
+        last reset as (seq, content) pairs and their emotions as (emotion,
+        probs) pairs, and its newest ``page`` messages"""
+        self.flush()
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT start_seq, eq_score, turn_mode, summary, summary_upto FROM sessions WHERE id = ?",
+                (session,)
+            ).fetchone()
+            if row is None:
+                return None
+            start, eq_score, turn_mode, summary, summary_upto = row
+            rows = self._db.execute(
+                "SELECT seq, content, emotion, emotion_probs FROM messages "
+                "WHERE session_id = ? AND role = 'user' AND seq >= ? ORDER BY seq",
+                (session, start)
+            ).fetchall()
+        messages, offset = self.older(session, None, page, start)
+        return {"eq_score": eq_score, "turn_mode": turn_mode, "summary": summary, "summary_upto": summary_upto,
+                "start": start, "offset": offset,
+                "user_messages": [(seq, content) for seq, content, _, _ in rows],
+                "emotions": [(emotion, json.loads(probs) if probs else None) for _, _, emotion, probs in rows],
+                "messages": messages}
+
+    def older(self, session, before, page=50, start=0):
+        """Up to ``page`` messages of ``session`` before seq ``before`` (None: the
+        newest ones) and from ``start`` on, oldest first, and the seq of the first"""
+        self.flush()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT seq, role, content, emotion, emotion_probs, time FROM messages "
+                "WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session, start, before if before is not None else 2**62, page)
+            ).fetchall()
+        messages = []
+        for seq, role, content, emotion, probs, stamp in reversed(rows):
+            message = {"role": role, "content": content, "time": stamp}
+            if emotion:
+                message["emotion"] = emotion
+            if probs:
+                message["emotion_probs"] = json.loads(probs)
+            messages.append(message)
+        return messages, rows[-1][0] if rows else (before if before is not None else start)
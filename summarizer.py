@@ -0,0 +1,65 @@
+import logging
+import threading
+
+
+class RollingSummary:
+    """Running summary of the older part of one conversation.
+
+    Once more than ``keep_recent + block`` messages are not yet covered by the
+    summary, the oldest ``block`` of them is folded into it on a background
+    worker. Only that block and the previous summary are sent, never the full
+    transcript, and the user's turn never waits for it. ``upto`` is the number
+    of leading messages the summary stands in for; a summary saved earlier is
+    picked up by passing both back in. ``on_fold(summary, upto)`` is called
+    on the worker after each fold, e.g. to persist them.
+    """
+
+    def __init__(self, keep_recent=24, block=12, summary="", upto=0, on_fold=None):
+        self.keep_recent = keep_recent
+        self.block = block
+        self.summary = summary
+        self.upto = upto
+        self.on_fold = on_fold
+        self.folds = 0
+        self._pending = False
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return self.summary, self.upto
+
+    def schedule(self, executor, messages, summarize, offset=0):
+        """Submit the next fold to ``executor`` if one is due.
+
+        ``messages`` are the conversation from message ``offset`` on (a resumed
+        chat may not have the older ones loaded); the summary never skips past
+        messages it could not see. summarize(previous_summary, block_of_messages)
+        -> new summary; it runs on the worker, so the block is copied here on
+        the caller's thread.
+        """
+        with self._lock:
+            if self._pending or offset + len(messages) - self.upto < self.keep_recent + self.block:
+                return None
+            if self.upto < offset:
+                logging.warning(f"Messages {self.upto}-{offset} are not loaded, the summary skips them")
+            self._pending = True
+            start, previous = max(self.upto, offset), self.summary
+            block = list(messages[start - offset:start - offset + self.block])
+
+        def fold():
+            summary = None
+            try:
+                summary = summarize(previous, block)
+            except Exception as e:
+                logging.warning(f"Summary of messages {start}-{start + len(block)} failed: {e}")
+            with self._lock:
+                self._pending = False
+                if summary:
+                    self.summary = summary
+                    self.upto = start + len(block)
+                    self.folds += 1
+                on_fold = self.on_fold if summary else None
+            if on_fold:
+                on_fold(summary, start + len(block))
+
+        return executor.submit(fold)
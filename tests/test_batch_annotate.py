@@ -0,0 +1,37 @@
+import json
+from types import SimpleNamespace
+
+from batch_annotate import Checkpoint, annotate
+from mock_llm_server import label_for
+
+
+class FakeChat:
+    """Answers like the mock server, but runs out of tokens on batches over ``fits`` messages"""
+
+    def __init__(self, fits):
+        self.fits = fits
+        self.batch_sizes = []
+
+    def create(self, messages, max_tokens, **kwargs):
+        batch = json.loads(messages[-1]["content"])
+        self.batch_sizes.append(len(batch))
+        content = json.dumps({"labels": [{"id": m["id"], "emotion": label_for(m["text"])} for m in batch]})
+        finish_reason = "stop"
+        if len(batch) > self.fits:
+            content, finish_reason = content[:len(content) // 2], "length"
+        return SimpleNamespace(choices=[SimpleNamespace(
+            message=SimpleNamespace(content=content), finish_reason=finish_reason
+        )])
+
+
+def test_truncated_batches_are_split_before_they_are_retried(tmp_path):
+    texts = [f"message {i} about how worried I am" for i in range(8)]
+    chat = FakeChat(fits=4)
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"), "gpt-4o-mini")
+
+    done, missing = annotate(texts, chat, checkpoint, "gpt-4o-mini", batch_size=8, max_chars=10_000, concurrency=2)
+
+    assert (done, missing) == (8, 0)
+    assert chat.batch_sizes == [8, 4, 4]
+    assert set(checkpoint.labels.values()) == {"anxiety"}
+    checkpoint.close()
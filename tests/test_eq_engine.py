@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from config import EMOTIONS, EQ_WEIGHTS
+from eq_engine import EQEngine, EmotionTrack
+
+
+def sequential(engine, deltas):
+    """The recurrence turn by turn, as the app used to update the score"""
+    out = np.empty(deltas.shape)
+    for i, row in enumerate(deltas):
+        eq = engine.start
+        for t, weight in enumerate(row):
+            eq = min(max(engine.start + engine.decay * (eq - engine.start) + weight, engine.low), engine.high)
+            out[i, t] = eq
+    return out
+
+
+@pytest.mark.parametrize("decay", [1.0, 0.98, 0.9, 0.5])
+def test_scan_matches_the_sequential_loop(decay):
+    engine = EQEngine(decay=decay)
+    rng = np.random.default_rng(0)
+    # Long enough to span several blocks; sessions that drift, cross a bound or stay inside
+    deltas = np.concatenate([
+        rng.normal(0, 3, (20, 700)),
+        rng.normal(30, 5, (5, 700)),
+        rng.normal(0, 0.01, (5, 700)),
+    ])
+    np.testing.assert_allclose(engine.scan(deltas), sequential(engine, deltas), atol=1e-9)
+
+
+def test_rescore_matches_per_session_scores():
+    engine = EQEngine(decay=0.9)
+    rng = np.random.default_rng(1)
+    tracks = []
+    for length in [0, 1, 2, 3, 64, 65, 300]:
+        track = EmotionTrack()
+        for _ in range(length):
+            emotion = EMOTIONS[rng.integers(len(EMOTIONS))]
+            # Odd lengths mix in distributions, even ones are codes only
+            track.append(emotion, {emotion: 0.6, "neutral": 0.4} if length % 2 and rng.random() < 0.5 else None)
+        tracks.append(track)
+    inverted = {emotion: -weight for emotion, weight in EQ_WEIGHTS.items()}
+
+    final = engine.rescore(tracks, [EQ_WEIGHTS, inverted])
+
+    assert final.shape == (2, len(tracks))
+    for i, track in enumerate(tracks):
+        assert final[0, i] == pytest.approx(engine.score(track))
+        expected = engine.trajectory(track, engine.weight_vector(inverted))[-1] if len(track) else engine.start
+        assert final[1, i] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("decay", [1.0, 0.9])
+def test_step_extends_the_trajectory(decay):
+    engine = EQEngine(decay=decay)
+    rng = np.random.default_rng(2)
+    track, scores = EmotionTrack(), []
+    for i in range(400):
+        # Mostly negative emotions, so the score sits on the lower bound for a while
+        emotion = EMOTIONS[rng.integers(1, 5)] if i < 200 else EMOTIONS[rng.integers(len(EMOTIONS))]
+        track.append(emotion, {emotion: 0.7, "neutral": 0.3} if i % 3 == 0 else None)
+        scores.append(engine.step(scores[-1] if scores else engine.start, track))
+    np.testing.assert_allclose(scores, engine.trajectory(track), atol=1e-9)
@@ -0,0 +1,92 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from config import EMOTIONS
+from logprob_classifier import LogprobClassifier
+from mock_llm_server import classify_answer, completion_text, label_for, logprobs_for
+
+
+class FakeEncoding:
+    """One token per character pair, so labels sharing a prefix share a first token"""
+
+    def __init__(self, width):
+        self.width = width
+        self._ids = {}
+
+    def encode(self, text):
+        pieces = [text[i:i + self.width] for i in range(0, len(text), self.width)]
+        return [self._ids.setdefault(piece, len(self._ids)) for piece in pieces]
+
+    def decode(self, tokens):
+        pieces = {i: piece for piece, i in self._ids.items()}
+        return "".join(pieces[t] for t in tokens)
+
+
+def response(text, top=None):
+    logprobs = None
+    if top is not None:
+        logprobs = SimpleNamespace(content=[SimpleNamespace(top_logprobs=[
+            SimpleNamespace(token=token, logprob=math.log(p)) for token, p in top
+        ])])
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text), logprobs=logprobs)])
+
+
+def test_first_tokens_when_they_are_distinct():
+    classifier = LogprobClassifier(["happiness", "sadness", "neutral"], FakeEncoding(3))
+    assert classifier.codes == classifier.labels
+
+    probs = classifier.distribution(response("hap", [("hap", 0.6), ("sad", 0.2), ("xyz", 0.1)]))
+
+    assert probs == pytest.approx({"happiness": 0.75, "sadness": 0.25, "neutral": 0.0})
+
+
+def test_letter_codes_when_first_tokens_collide():
+    classifier = LogprobClassifier(EMOTIONS, FakeEncoding(1))  # "sadness" and "surprise" both start with "s"
+    assert classifier.codes[:3] == ["A", "B", "C"]
+    assert "B = sadness" in classifier.instructions()
+
+    probs = classifier.distribution(response("B", [("B", 0.5), ("C", 0.3), ("N", 0.2)]))
+
+    assert probs["sadness"] == pytest.approx(0.5)
+    assert probs["fear"] == pytest.approx(0.3)
+    assert probs["neutral"] == pytest.approx(0.2)
+    assert sum(probs.values()) == pytest.approx(1)
+
+
+def test_text_answer_without_logprobs_is_one_hot():
+    classifier = LogprobClassifier(EMOTIONS, FakeEncoding(1))
+    assert classifier.distribution(response("Anger.")) == {e: float(e == "anger") for e in EMOTIONS}
+    assert classifier.distribution(response("C"))["fear"] == 1.0
+    assert classifier.distribution(response("no idea"))["neutral"] == 1.0
+
+
+@pytest.mark.parametrize("width", [1, 3])
+def test_mock_server_answers_feed_the_distribution(width):
+    classifier = LogprobClassifier(EMOTIONS, FakeEncoding(width))
+    text = "I am so worried about tomorrow"
+    request = {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": f"Classify the dominant emotion from: {', '.join(EMOTIONS)}. "
+                                          f"{classifier.instructions()}"},
+            {"role": "user", "content": text},
+        ],
+        **classifier.request_kwargs(),
+    }
+    completion = ChatCompletion.model_validate({
+        "id": "mock", "object": "chat.completion", "created": 0, "model": "gpt-3.5-turbo",
+        "choices": [{"index": 0, "finish_reason": "stop", "logprobs": logprobs_for(request, text),
+                     "message": {"role": "assistant", "content": completion_text(request)}}],
+    })
+
+    probs = classifier.distribution(completion)
+
+    assert max(probs, key=probs.get) == label_for(text) == "anxiety"
+    assert probs["anxiety"] == pytest.approx(0.7)
+    assert sum(p > 0 for p in probs.values()) == min(request["top_logprobs"], len(EMOTIONS))
+    # One token, like max_tokens=1 asks for
+    assert completion_text(request) == classify_answer(request, text)[0][0]
+    assert completion_text(request) in classifier.codes
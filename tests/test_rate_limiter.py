@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import FairRateLimiter, RateLimitTimeout
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.001)
+
+
+def test_sessions_interleave_instead_of_queueing_behind_a_busy_one():
+    # One request per 50ms and no token limit, so every call below has to queue
+    limiter = FairRateLimiter(rpm=1200, tpm=10**9, burst_seconds=0.01)
+    limiter.acquire("warmup", 1)
+    order, lock, threads = [], threading.Lock(), []
+
+    def call(session, name):
+        limiter.acquire(session, 100)
+        with lock:
+            order.append(name)
+
+    for session, name in [("busy", "busy-1"), ("busy", "busy-2"), ("busy", "busy-3"), ("quiet", "quiet-1")]:
+        thread = threading.Thread(target=call, args=(session, name))
+        thread.start()
+        threads.append(thread)
+        # Queue them in this order
+        wait_until(lambda: limiter.stats()["queued"] + len(order) == len(threads))
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["busy-1", "quiet-1", "busy-2", "busy-3"]
+    assert limiter.stats()["granted"] == 5
+
+
+def test_timeout_leaves_the_queue():
+    limiter = FairRateLimiter(rpm=60, tpm=10**9, burst_seconds=1)
+    limiter.acquire("a", 1)
+
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("b", 1, timeout=0.05)
+    assert time.monotonic() - started < 0.5
+    stats = limiter.stats()
+    assert stats["timeouts"] == 1
+    assert stats["queued"] == 0
+
+    # The abandoned entry doesn't block the next caller once capacity returns
+    assert limiter.acquire("c", 1, timeout=2) <= 2
+    assert limiter.stats()["granted"] == 2
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import resilience
+from rate_limiter import FairRateLimiter
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCompletions
+
+
+def test_half_open_allows_a_single_trial(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    # After reset_timeout exactly one caller gets through
+    clock[0] += 30
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    # A failed trial reopens it for another reset_timeout
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+    clock[0] += 29
+    assert not breaker.allow()
+
+    # A successful trial closes it
+    clock[0] += 1
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+    assert breaker.failures == 0
+
+
+class FailingClient:
+    """Stands in for the OpenAI client; every call fails with a retryable error"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, **options):
+        return self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        raise openai.APIConnectionError(request=httpx.Request("POST", "http://mock/v1/chat/completions"))
+
+
+def test_open_breaker_fails_fast_before_the_rate_limiter(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    client = FailingClient()
+    limiter = FairRateLimiter(rpm=600, tpm=10**9)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    completions = ResilientCompletions(client, breaker, max_attempts=2, limiter=limiter)
+
+    with pytest.raises(openai.APIConnectionError):
+        completions.create(model="gpt-3.5-turbo", messages=[])
+    assert breaker.state == "open"
+    assert limiter.stats()["granted"] == 2
+
+    with pytest.raises(CircuitOpenError):
+        completions.create(model="gpt-3.5-turbo", messages=[])
+    assert limiter.stats()["granted"] == 2
+    assert client.calls == 2
+
+    # Checking doesn't use up the trial: once due, the next call makes it, and
+    # its retry fails fast on the reopened breaker
+    clock[0] += 30
+    assert not breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        completions.create(model="gpt-3.5-turbo", messages=[])
+    assert client.calls == 3
+    assert limiter.stats()["granted"] == 3
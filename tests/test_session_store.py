@@ -0,0 +1,99 @@
+import pytest
+
+from session_store import SessionStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "sessions.sqlite3")
+
+
+def message(content, role="user", **extra):
+    return {"role": role, "content": content, "time": "12:00", **extra}
+
+
+def contents(saved):
+    return [m["content"] for m in saved["messages"]]
+
+
+def test_two_tabs_appending_to_one_session_keep_both_messages(path):
+    tab_a, tab_b = SessionStore(path, commit_interval=3600), SessionStore(path, commit_interval=3600)
+    tab_a.append("s", message("hello"))
+    tab_a.flush()
+    assert contents(tab_a.load("s")) == contents(tab_b.load("s")) == ["hello"]
+
+    # Both resumed the same session and each appends before either commits
+    tab_a.append("s", message("tab A msg"))
+    tab_b.append("s", message("tab B msg"))
+    tab_a.flush()
+    tab_b.flush()
+
+    assert contents(tab_a.load("s")) == ["hello", "tab A msg", "tab B msg"]
+    tab_a.close()
+    tab_b.close()
+
+
+def test_reset_starts_over_after_the_queued_messages(path):
+    store = SessionStore(path, commit_interval=3600)
+    store.append("s", message("before", emotion="sadness", emotion_probs={"sadness": 0.9, "neutral": 0.1}))
+    store.append("s", message("reply", role="assistant"))
+    store.flush()
+    store.append("s", message("also before", emotion="anger"))
+    store.reset("s")
+    store.append("s", message("after", emotion="joy"))
+    store.save("s", eq_score=57, turn_mode="two_call")
+    store.close()
+
+    saved = SessionStore(path, commit_interval=3600).load("s")
+    assert contents(saved) == ["after"]
+    assert saved["start"] == saved["offset"] == 3
+    assert saved["emotions"] == [("joy", None)]
+    assert (saved["eq_score"], saved["turn_mode"]) == (57, "two_call")
+
+
+def test_resume_pages_back_to_the_last_reset(path):
+    store = SessionStore(path, commit_interval=3600)
+    store.append("s", message("old"))
+    store.reset("s")
+    for i in range(5):
+        store.append("s", message(f"m{i}", emotion="neutral"))
+
+    saved = store.load("s", page=2)
+    assert contents(saved) == ["m3", "m4"]
+    assert saved["start"] == 1
+    assert len(saved["emotions"]) == 5
+    older, offset = store.older("s", saved["offset"], 2, saved["start"])
+    assert [m["content"] for m in older] == ["m1", "m2"]
+    older, offset = store.older("s", offset, 2, saved["start"])
+    assert [m["content"] for m in older] == ["m0"]
+    assert offset == saved["start"]
+    assert store.load("unknown") is None
+    store.close()
+
+
+def test_resume_returns_the_summary_and_every_user_message(path):
+    store = SessionStore(path, commit_interval=3600)
+    for i in range(6):
+        store.append("s", message(f"u{i}", emotion="joy"))
+        store.append("s", message(f"a{i}", role="assistant"))
+    store.save("s", summary="Talked about work", summary_upto=8)
+
+    saved = store.load("s", page=2)
+    assert contents(saved) == ["u5", "a5"]
+    assert (saved["summary"], saved["summary_upto"]) == ("Talked about work", 8)
+    assert saved["user_messages"] == [(2 * i, f"u{i}") for i in range(6)]
+    store.close()
+
+
+def test_opens_a_database_from_before_summaries(path):
+    import sqlite3
+
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE sessions (id TEXT PRIMARY KEY, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+               "start_seq INTEGER NOT NULL DEFAULT 0, eq_score INTEGER, turn_mode TEXT)")
+    db.execute("INSERT INTO sessions VALUES ('s', 0, 0, 0, 60, 'two_call')")
+    db.commit()
+    db.close()
+
+    saved = SessionStore(path, commit_interval=3600).load("s")
+    assert (saved["eq_score"], saved["summary"], saved["summary_upto"]) == (60, None, 0)
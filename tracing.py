@@ -0,0 +1,176 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import TRACE_EXPORTER, TRACE_PATH
+
+# Span that new spans in this thread (or a copied context) become children of
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._started = time.perf_counter()
+
+    @property
+    def duration(self):
+        """Seconds, so far if the span hasn't ended yet"""
+        if self.end_ns is not None:
+            return (self.end_ns - self.start_ns) / 1e9
+        return time.perf_counter() - self._started
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def end(self):
+        """Finish the span and hand it to the exporter; later calls do nothing"""
+        if self.end_ns is None:
+            self.end_ns = self.start_ns + int((time.perf_counter() - self._started) * 1e9)
+            self.tracer.exporter.export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class NullExporter:
+    def export(self, span):
+        pass
+
+
+class JsonlExporter:
+    """One JSON object per finished span, appended to ``path``"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def format(self, span):
+        return span.to_dict()
+
+    def export(self, span):
+        line = json.dumps(self.format(span), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+class OtlpFileExporter(JsonlExporter):
+    """OTLP/JSON lines, the format the OpenTelemetry collector's file exporter
+    writes and its otlpjsonfile receiver reads, one span per request"""
+
+    def __init__(self, path, service_name="emogenie"):
+        super().__init__(path)
+        self.service_name = service_name
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def format(self, span):
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": self._value(v)} for k, v in span.attributes.items()],
+            "status": {"code": 1 if span.status == "ok" else 2},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "emogenie.tracing"}, "spans": [otlp_span]}],
+        }]}
+
+
+EXPORTERS = {"jsonl": JsonlExporter, "otlp": OtlpFileExporter}
+
+
+class Tracer:
+    """Minimal span tracer.
+
+    ``span()`` nests through a context variable, so spans opened on worker
+    threads that run in a copied context (turn pipeline, hedging) land under
+    the turn that started them. ``start_span()`` returns a span the caller
+    ends itself, for work that outlives one block, like a turn whose rerun
+    is only rendered by the next script run. Any object with an
+    ``export(span)`` method can be the exporter.
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter or NullExporter()
+
+    def start_span(self, name, parent=None, **attributes):
+        """New span under ``parent`` (default: the current span); end() it when done"""
+        return Span(self, name, parent or _current_span.get(), attributes)
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        span = self.start_span(name, parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def set_current_span(span):
+    """Make ``span`` (or None) the parent of new spans in this context until changed again"""
+    _current_span.set(span)
+
+
+_tracer = None
+_lock = threading.Lock()
+
+
+def get_tracer():
+    """Process-wide tracer with the exporter chosen by TRACE_EXPORTER in config"""
+    global _tracer
+    if _tracer is None:
+        with _lock:
+            if _tracer is None:
+                if TRACE_EXPORTER and TRACE_EXPORTER not in EXPORTERS:
+                    raise ValueError(f"Unknown trace exporter {TRACE_EXPORTER!r}, expected one of {list(EXPORTERS)}")
+                _tracer = Tracer(EXPORTERS[TRACE_EXPORTER](TRACE_PATH) if TRACE_EXPORTER else None)
+    return _tracer
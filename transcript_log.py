@@ -0,0 +1,164 @@
+"""Append-only, segmented JSONL log of every chat message.
+
+Each record is one line: ``{"ts", "session", "role", "content", "emotion",
+...}``, or ``{"ts", "session", "event": "reset"}`` when a chat is cleared.
+The segment being written is ``<started>-<pid>-<n>.jsonl.open``; it is
+renamed to ``.jsonl`` once it reaches its size limit or the process shuts
+down, so readers can take sealed segments as final. Lines are buffered in
+memory and written + fsynced by a background thread every
+``fsync_interval`` seconds, so a crash loses at most that much.
+
+Records stream one line at a time (``read_records``, or pandas'
+``read_json(path, lines=True, chunksize=...)``):
+
+    python transcript_log.py stats transcripts/
+    python transcript_log.py session transcripts/ 3f2a9c...
+"""
+import argparse
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+
+class TranscriptLog:
+    def __init__(self, directory, segment_bytes=64 * 2**20, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.prefix = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self.records = 0
+        self.syncs = 0
+        self._segment = 0
+        self._file = None
+        self._size = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="transcript-log")
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, session, record):
+        """Queue one record; it is on disk within ``fsync_interval`` seconds"""
+        line = json.dumps({"ts": time.time(), "session": session, **record}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+
+    def flush(self):
+        """Write and fsync everything appended so far"""
+        with self._write_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            data = "".join(lines).encode("utf-8")
+            try:
+                if self._file is None or self._size + len(data) > self.segment_bytes and self._size:
+                    self._rotate()
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError:
+                # Keep the lines for the next attempt
+                with self._lock:
+                    self._buffer[:0] = lines
+                raise
+            self._size += len(data)
+            self.records += len(lines)
+            self.syncs += 1
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{self.prefix}-{segment:06d}.jsonl")
+
+    def _seal(self):
+        if self._file is not None:
+            self._file.close()
+            os.replace(self._path(self._segment) + ".open", self._path(self._segment))
+            self._file = None
+
+    def _rotate(self):
+        self._seal()
+        self._segment += 1
+        self._file = open(self._path(self._segment) + ".open", "ab")
+        self._size = 0
+
+    def _run(self):
+        while not self._closed.wait(self.fsync_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                logging.error(f"Transcript log write failed, retrying: {e}")
+
+    def close(self):
+        """Flush and seal the open segment"""
+        self._closed.set()
+        self.flush()
+        with self._write_lock:
+            self._seal()
+
+
+def segments(directory, include_open=False):
+    """Segment paths in write order (per process)"""
+    paths = glob.glob(os.path.join(directory, "*.jsonl"))
+    if include_open:
+        paths += glob.glob(os.path.join(directory, "*.jsonl.open"))
+    return sorted(paths)
+
+
+def read_records(paths):
+    """Records of ``paths`` one at a time; a line torn by a crash is skipped"""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the transcript log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats_cmd = commands.add_parser("stats", help="messages by role and emotion, and session count")
+    stats_cmd.add_argument("directory")
+    stats_cmd.add_argument("--include-open", action="store_true", help="also read segments still being written")
+    session_cmd = commands.add_parser("session", help="print one session's transcript")
+    session_cmd.add_argument("directory")
+    session_cmd.add_argument("session_id")
+    session_cmd.add_argument("--include-open", action="store_true", help="also read segments still being written")
+    args = parser.parse_args()
+
+    records = read_records(segments(args.directory, args.include_open))
+    if args.command == "stats":
+        roles, emotions, sessions = Counter(), Counter(), set()
+        for record in records:
+            sessions.add(record["session"])
+            if "role" in record:
+                roles[record["role"]] += 1
+            if record.get("emotion"):
+                emotions[record["emotion"]] += 1
+        print(f"{len(sessions)} sessions, {sum(roles.values())} messages ({dict(roles)})")
+        for emotion, count in emotions.most_common():
+            print(f"{emotion:>12}: {count}")
+    else:
+        for record in records:
+            if record["session"] != args.session_id:
+                continue
+            stamp = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+            if "event" in record:
+                print(f"{stamp} -- {record['event']} --")
+            else:
+                emotion = f" [{record['emotion']}]" if record.get("emotion") else ""
+                print(f"{stamp} {record['role']}{emotion}: {record['content']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+RECONCILE_POLICIES = ["accept", "regenerate"]
+
+
+class ConcurrentTurnPipeline:
+    """Runs emotion classification in parallel with response generation.
+
+    The reply is generated straight away on the caller's thread using a
+    guessed emotion (the previous turn's label, or None for an
+    emotion-agnostic prompt) while the classifier runs on the thread pool.
+    When the fresh label disagrees with the guess the turn is reconciled
+    according to ``policy``: "accept" keeps the reply that was already
+    generated, "regenerate" asks again with the correct emotion once the
+    guessed reply has finished, so a mismatched turn costs two reply
+    latencies back to back. Replies made with an emotion-agnostic prompt are
+    never regenerated.
+
+    One pipeline is shared by every session in the process, so the callables
+    are passed per turn. Only ``classify`` takes a pool thread (and must not
+    touch ``st.session_state``), so ``max_workers`` is the number of
+    concurrent-mode turns that can overlap their classification.
+    """
+
+    def __init__(self, policy="accept", max_workers=32):
+        if policy not in RECONCILE_POLICIES:
+            raise ValueError(f"Unknown reconcile policy {policy!r}, expected one of {RECONCILE_POLICIES}")
+        self.policy = policy
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="turn")
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.guessed = 0
+        self.mismatches = 0
+        self.regenerations = 0
+
+    def run(self, text, classify, respond, prompt_for, guess=None):
+        """Return (emotion, reply) for one user turn.
+
+        classify(text) -> emotion, respond(system_prompt, text) -> reply and
+        prompt_for(emotion_or_None) -> system_prompt.
+        """
+        # The worker runs in a copy of the caller's context (e.g. its session id)
+        label_future = self._pool.submit(contextvars.copy_context().run, classify, text)
+        reply = respond(prompt_for(guess), text)
+
+        emotion = label_future.result()
+        mismatch = guess is not None and guess != emotion
+        if mismatch and self.policy == "regenerate":
+            reply = respond(prompt_for(emotion), text)
+
+        with self._lock:
+            self.turns += 1
+            self.guessed += guess is not None
+            self.mismatches += mismatch
+            self.regenerations += mismatch and self.policy == "regenerate"
+        return emotion, reply
+
+    def stats(self):
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "guessed": self.guessed,
+                "mismatches": self.mismatches,
+                "regenerations": self.regenerations,
+                "mismatch_rate": self.mismatches / self.guessed if self.guessed else 0.0,
+            }
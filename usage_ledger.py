@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIELDS = ["calls", "prompt_tokens", "completion_tokens", "cost", "latency"]
+
+
+def usage_of(response):
+    """(prompt_tokens, completion_tokens) reported by a completion or final stream chunk"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+
+class UsageLedger:
+    """Tokens, cost and latency of every LLM call, per call kind, per session
+    and for the whole process.
+
+    ``prices`` maps a model to its (prompt, completion) USD per million
+    tokens; unknown models are counted at zero cost. Only the
+    ``max_sessions`` most recently active sessions are kept. Calls the
+    command router answered locally are counted separately, by route.
+    """
+
+    def __init__(self, prices=None, max_sessions=10_000):
+        self.prices = prices or {}
+        self.max_sessions = max_sessions
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._process = {}
+        self._sessions = OrderedDict()
+        self._saved = {}
+
+    @staticmethod
+    def _add(table, key, values):
+        row = table.setdefault(key, dict.fromkeys(FIELDS, 0))
+        for field, value in zip(FIELDS, values):
+            row[field] += value
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def record(self, session, kind, model, prompt_tokens, completion_tokens, latency):
+        values = (1, prompt_tokens, completion_tokens, self.cost(model, prompt_tokens, completion_tokens), latency)
+        with self._lock:
+            self._add(self._process, (kind, model), values)
+            if session is not None:
+                self._sessions.setdefault(session, {})
+                self._sessions.move_to_end(session)
+                self._add(self._sessions[session], kind, values)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+
+    def record_saved(self, route, calls):
+        """``calls`` LLM calls an input routed to ``route`` did not need"""
+        with self._lock:
+            self._saved[route] = self._saved.get(route, 0) + calls
+
+    def saved(self):
+        """{route: calls saved} for this process"""
+        with self._lock:
+            return dict(self._saved)
+
+    def session(self, session):
+        """{kind: totals} for one session"""
+        with self._lock:
+            return {kind: dict(row) for kind, row in self._sessions.get(session, {}).items()}
+
+    def process(self):
+        """{(kind, model): totals} for every call this process made"""
+        with self._lock:
+            return {key: dict(row) for key, row in self._process.items()}
+
+    @staticmethod
+    def total(rows):
+        totals = dict.fromkeys(FIELDS, 0)
+        for row in rows.values():
+            for field in FIELDS:
+                totals[field] += row[field]
+        return totals
+
+    def snapshot(self):
+        """Process totals by kind and model, as plain JSON. Session ids are
+        enough to resume a chat, so sessions are only counted, never listed"""
+        with self._lock:
+            sessions = len(self._sessions)
+        return {
+            "uptime": time.time() - self.started,
+            "process": [{"kind": kind, "model": model, **row} for (kind, model), row in self.process().items()],
+            "sessions": sessions,
+            "saved_calls": self.saved(),
+        }
+
+    def prometheus(self):
+        """Process totals in the Prometheus text exposition format"""
+        metrics = [
+            ("calls", "emogenie_llm_calls_total", "LLM calls"),
+            ("prompt_tokens", "emogenie_llm_prompt_tokens_total", "Prompt tokens sent"),
+            ("completion_tokens", "emogenie_llm_completion_tokens_total", "Completion tokens received"),
+            ("cost", "emogenie_llm_cost_usd_total", "Estimated spend in USD"),
+            ("latency", "emogenie_llm_latency_seconds_total", "Time spent waiting for LLM calls"),
+        ]
+        process = self.process()
+        lines = []
+        for field, name, help_text in metrics:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (kind, model), row in sorted(process.items()):
+                lines.append(f'{name}{{kind="{kind}",model="{model}"}} {row[field]}')
+        lines += ["# HELP emogenie_llm_calls_saved_total LLM calls avoided by routing inputs locally",
+                  "# TYPE emogenie_llm_calls_saved_total counter"]
+        for route, calls in sorted(self.saved().items()):
+            lines.append(f'emogenie_llm_calls_saved_total{{route="{route}"}} {calls}')
+        with self._lock:
+            sessions = len(self._sessions)
+        lines += ["# HELP emogenie_sessions Sessions with recorded usage",
+                  "# TYPE emogenie_sessions gauge", f"emogenie_sessions {sessions}"]
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(ledger, host="127.0.0.1", port=9101):
+    """Serve /metrics (Prometheus) and /metrics.json on a background thread.
+    Unauthenticated, so only bind beyond localhost on a private network"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = ledger.prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(ledger.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server